@@ -0,0 +1,307 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# asyncio support (python 3.6+). Requests are prepared and decoded by the
+# same ParseBase methods as the blocking API, only the transport differs.
+# Nothing here needs to be imported directly: use ParseBase.aexecute,
+# ParseResource.asave/adelete, `async for` on a Queryset and
+# ParseBatcher.abatch.
+
+import asyncio
+import json
+import ssl
+import time
+
+from six.moves.urllib.parse import urlparse, quote
+
+from parse_rest import connection
+
+
+class AsyncConnectionPool(object):
+    """
+    Keep-alive HTTP/1.1 connections over asyncio streams, pooled per
+    (event loop, scheme, host, port). Same settings as
+    connection.ConnectionPool.
+    """
+
+    def __init__(self, maxsize=connection.POOL_MAXSIZE,
+                 idle_timeout=connection.POOL_IDLE_TIMEOUT,
+                 timeout=connection.CONNECTION_TIMEOUT):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle = {}
+        self._ssl_context = ssl.create_default_context()
+
+    def _get(self, key):
+        idle = self._idle.get(key, [])
+        while idle:
+            (reader, writer), released = idle.pop()
+            if time.time() - released <= self.idle_timeout and not reader.at_eof():
+                return reader, writer
+            writer.close()
+        return None
+
+    def _put(self, key, stream):
+        # forget connections of event loops that have been closed
+        for stale in [k for k in self._idle if k[0].is_closed()]:
+            del self._idle[stale]
+        idle = self._idle.setdefault(key, [])
+        idle.append((stream, time.time()))
+        while len(idle) > self.maxsize:
+            idle.pop(0)[0][1].close()
+
+    def clear(self):
+        """Close every idle connection in the pool"""
+        for idle in self._idle.values():
+            for (reader, writer), _ in idle:
+                writer.close()
+        self._idle = {}
+
+    async def urlopen(self, method, url, body=None, headers=None):
+        """
+        Send a request over a pooled connection and return the response
+        status and body. Stale reused connections are retried like in
+        connection.ConnectionPool.urlopen.
+        """
+        parts = urlparse(url)
+        scheme = parts.scheme
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (asyncio.get_event_loop(), scheme, parts.hostname, port)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        target = quote(target, safe="/?&=%:+,;@$!~*'()")
+
+        stream = self._get(key)
+        while True:
+            reused = stream is not None
+            if not reused:
+                stream = await asyncio.wait_for(asyncio.open_connection(
+                    parts.hostname, port,
+                    ssl=self._ssl_context if scheme == 'https' else None),
+                    self.timeout)
+            try:
+                try:
+                    await asyncio.wait_for(self._send(
+                        stream, method, target, parts.netloc, body, headers or {}),
+                        self.timeout)
+                except (BrokenPipeError, ConnectionResetError):
+                    if reused:
+                        stream[1].close()
+                        stream = None
+                        continue
+                    raise
+                try:
+                    status_line = await asyncio.wait_for(stream[0].readline(), self.timeout)
+                except ConnectionResetError:
+                    status_line = b''
+                if not status_line:
+                    # the server may have handled the request before closing
+                    # the connection: only resend what can safely be sent twice
+                    if reused and method in connection.IDEMPOTENT_METHODS:
+                        stream[1].close()
+                        stream = None
+                        continue
+                    raise ConnectionResetError('connection closed by server')
+                status, content, keep_alive = await asyncio.wait_for(
+                    self._receive(stream[0], status_line), self.timeout)
+            except BaseException:
+                stream[1].close()
+                raise
+            break
+
+        if keep_alive:
+            self._put(key, stream)
+        else:
+            stream[1].close()
+        return status, content
+
+    @staticmethod
+    async def _send(stream, method, target, host, body, headers):
+        writer = stream[1]
+        lines = ['%s %s HTTP/1.1' % (method, target), 'Host: %s' % host]
+        lines.extend('%s: %s' % item for item in headers.items())
+        lines.append('Content-Length: %d' % len(body or b''))
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        if body:
+            writer.write(body)
+        await writer.drain()
+
+    @staticmethod
+    async def _receive(reader, status_line):
+        version, status = status_line.split(None, 2)[:2]
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        keep_alive = (version != b'HTTP/1.0' and
+                      response_headers.get('connection', '').lower() != 'close')
+        if 'chunked' in response_headers.get('transfer-encoding', '').lower():
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if not size:
+                    # skip trailers
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            content = b''.join(chunks)
+        elif 'content-length' in response_headers:
+            content = await reader.readexactly(int(response_headers['content-length']))
+        elif int(status) in (204, 304):
+            content = b''
+        else:
+            content = await reader.read()
+            keep_alive = False
+        return int(status), content, keep_alive
+
+
+POOL = AsyncConnectionPool()
+
+
+async def execute(cls, uri, http_verb, extra_headers=None, _body=None, **kw):
+    """awaitable ParseBase.execute, called as cls.aexecute(...)"""
+    url, data, headers = cls._prepare_request(
+        uri, http_verb, extra_headers=extra_headers, _body=_body, **kw)
+    status, content = await POOL.urlopen(http_verb, url, data, headers)
+    cls._invalidate_queries(http_verb, url, kw)
+    return cls._handle_response(status, content)
+
+
+async def run(method, extra_headers=None):
+    """
+    Run a create, update or delete method (anything accepting batch=True,
+    like ParseResource.save) without blocking: the request it would add to
+    a batch is sent on its own, with extra_headers, and its callback is run
+    with the response.
+    """
+    owner = method.__self__
+    klass = owner if isinstance(owner, type) else type(owner)
+    operation = method(batch=True)
+    if operation is None:
+        # nothing to send
+        return
+    query, callback = operation
+    root = urlparse(klass._get_client().api_root)
+    uri = '%s://%s%s' % (root.scheme, root.netloc, query['path'])
+    response = await execute(klass, uri, query['method'], extra_headers=extra_headers,
+                             **query.get('body', {}))
+    callback(response)
+
+
+async def batch(batcher, methods):
+    """awaitable ParseBatcher.batch"""
+    queries, callbacks, chunks = batcher._prepare(methods)
+    if not queries:
+        return
+    semaphore = asyncio.Semaphore(batcher.max_workers)
+
+    async def send(client, chunk):
+        async with semaphore:
+            with client:
+                return await execute(batcher.__class__, "", "POST",
+                                     requests=[queries[i] for i in chunk])
+
+    results = await asyncio.gather(*[send(client, chunk) for client, chunk in chunks],
+                                   return_exceptions=True)
+    batcher._run_chunk_callbacks([chunk for _, chunk in chunks], callbacks, results)
+
+
+async def query(manager, **options):
+    """awaitable QueryManager._query, through the client's query cache"""
+    klass = manager.model_class
+    cache = klass._get_client().query_cache
+    if cache is None:
+        return await execute(klass, klass.ENDPOINT_ROOT, 'GET', **options)
+    response, ticket = cache._lookup(klass, options)
+    if ticket is None:
+        return response
+    response = await execute(klass, klass.ENDPOINT_ROOT, 'GET', **options)
+    cache._store(ticket, response)
+    return response
+
+
+async def fetch(queryset):
+    """awaitable Queryset fetch, filling the result cache"""
+    if queryset._result_cache is None:
+        response = await query(queryset._manager, **queryset._query_options())
+        queryset._result_cache = queryset._materialize(response.get('results'))
+    return queryset._result_cache
+
+
+async def iterate(queryset):
+    for obj in await fetch(queryset):
+        yield obj
+
+
+async def count(queryset):
+    if queryset._result_cache is not None:
+        return len(queryset._result_cache)
+    options = queryset._query_options()
+    options['count'] = 1
+    options['limit'] = 0
+    options.pop('include', None)
+    response = await query(queryset._manager, **options)
+    return response.get('count')
+
+
+async def get(queryset):
+    if queryset._result_cache is not None:
+        return queryset._get_single(queryset._result_cache)
+    return queryset._get_single(await fetch(queryset[:2]))
+
+
+async def load(loader, object_id):
+    """
+    awaitable ObjectLoader.load: lookups made by tasks of the same event
+    loop iteration are sent together
+    """
+    credentials = loader._credentials()
+    if (credentials, object_id) in loader._cache:
+        return loader._cache[(credentials, object_id)]
+    loop = asyncio.get_event_loop()
+    key = (loop, credentials)
+    batch = loader._async_batches.get(key)
+    if batch is None:
+        batch = loader._async_batches[key] = ([], loop.create_future())
+        # runs once the tasks ready in this iteration have made their lookups
+        asyncio.ensure_future(_load_batch(loader, key, batch))
+    ids, done = batch
+    if object_id not in ids:
+        ids.append(object_id)
+    if len(ids) >= loader.max_batch and loader._async_batches.get(key) is batch:
+        del loader._async_batches[key]
+    await asyncio.shield(done)
+    return loader._result(credentials, object_id)
+
+
+async def _load_batch(loader, key, batch):
+    ids, done = batch
+    if loader._async_batches.get(key) is batch:
+        del loader._async_batches[key]
+    klass = loader.model_class
+    try:
+        response = await execute(klass, klass.ENDPOINT_ROOT, 'GET', limit=len(ids),
+                                 where=json.dumps({'objectId': {'$in': ids}}))
+        loader._store(key[1], klass.Query._materialize(response.get('results')))
+    except Exception as e:
+        done.set_exception(e)
+    else:
+        done.set_result(None)
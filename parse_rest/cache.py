@@ -0,0 +1,132 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import copy
+import json
+import threading
+import time
+
+from six.moves.urllib.parse import urlparse
+
+from parse_rest.connection import date_handler
+
+
+class QueryCache(object):
+    """
+    Responses of queries shared by every Queryset of a client.
+
+    Responses are kept `ttl` seconds, and the least recently used ones are
+    dropped beyond `max_size`. Queries are told apart by class, options
+    (where, order, keys...) and credentials, so users never see the results
+    of another user's session. Creates, updates and deletes of a class sent
+    through the client, batched or not, drop the cached queries of that
+    class. Enable it on a client:
+
+        connection.DEFAULT_CLIENT.query_cache = QueryCache(max_size=500, ttl=30)
+
+    Writes made by other processes are only seen once cached responses
+    expire.
+    """
+
+    def __init__(self, max_size=1000, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+        self._entries = collections.OrderedDict()
+        # bumped when a class is written to, per class endpoint
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _key(klass, options):
+        client = klass._get_client()
+        return (client.url(klass.ENDPOINT_ROOT),
+                json.dumps(options, sort_keys=True, default=date_handler),
+                client._credentials())
+
+    def fetch(self, klass, options, send):
+        """the cached response of a query of klass, or the one send() returns"""
+        response, ticket = self._lookup(klass, options)
+        if ticket is None:
+            return response
+        response = send()
+        self._store(ticket, response)
+        return response
+
+    def _lookup(self, klass, options):
+        """
+        the cached response of a query and None, or None and the ticket
+        _store() needs to cache the response once it is received
+        """
+        key = self._key(klass, options)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                # most recently used last
+                self._entries[key] = self._entries.pop(key)
+                self.hits += 1
+                return copy.deepcopy(entry[1]), None
+            self.misses += 1
+            return None, (key, self._generations.setdefault(key[0], 0))
+
+    def _store(self, ticket, response):
+        key, generation = ticket
+        with self._lock:
+            if self._generations.get(key[0]) != generation:
+                # the class was written to while the query was sent: the
+                # response may predate the write
+                return
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + self.ttl, copy.deepcopy(response))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    @staticmethod
+    def _matches(path, endpoint):
+        return path == endpoint or path.startswith(endpoint + '/')
+
+    def invalidate(self, url):
+        """drop the cached queries of the class url is about"""
+        parts = urlparse(url)
+        path = '%s://%s%s' % (parts.scheme, parts.netloc, parts.path.rstrip('/'))
+        with self._lock:
+            for endpoint in self._generations:
+                if self._matches(path, endpoint):
+                    self._generations[endpoint] += 1
+            for key in list(self._entries):
+                if self._matches(path, key[0]):
+                    del self._entries[key]
+                    self.invalidations += 1
+
+    def clear(self):
+        """drop every cached response"""
+        with self._lock:
+            self._entries.clear()
+            for endpoint in self._generations:
+                self._generations[endpoint] += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'size': len(self._entries),
+        }
@@ -11,11 +11,27 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from six.moves.urllib.request import Request, urlopen
-from six.moves.urllib.error import HTTPError
-from six.moves.urllib.parse import urlencode, urlparse
-
+from six.moves import http_client
+from six.moves.urllib.request import getproxies, proxy_bypass
+from six.moves.urllib.parse import urlencode, urlparse, quote
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:  # python 2
+    from collections import MutableMapping
+try:
+    from contextvars import ContextVar, copy_context
+except ImportError:  # python < 3.7
+    ContextVar = copy_context = None
+
+from concurrent.futures import ThreadPoolExecutor
+import errno
 import json
+import select
+import socket
+import ssl
+import threading
+import time
 
 from parse_rest import core
 
@@ -23,56 +39,466 @@ import os
 
 API_ROOT = os.environ.get('PARSE_API_ROOT') or 'https://api.parse.com/1'
 
-ACCESS_KEYS = {}
+
+class ContextLocal(object):
+    """
+    A value local to the current context: the current asyncio task or
+    thread with contextvars (python 3.7+), the current thread otherwise.
+    """
+
+    def __init__(self, name, default=None):
+        self._default = default
+        if ContextVar is not None:
+            self._var = ContextVar(name, default=default)
+            self._saved = ContextVar(name + '_saved', default=())
+        else:
+            self._local = threading.local()
+
+    def get(self):
+        if ContextVar is not None:
+            return self._var.get()
+        return getattr(self._local, 'value', self._default)
+
+    def set(self, value):
+        """set the value, returning the previous one"""
+        previous = self.get()
+        if ContextVar is not None:
+            self._var.set(value)
+        else:
+            self._local.value = value
+        return previous
+
+    def _get_saved(self):
+        if ContextVar is not None:
+            return self._saved.get()
+        return getattr(self._local, 'saved', ())
+
+    def _set_saved(self, saved):
+        if ContextVar is not None:
+            self._saved.set(saved)
+        else:
+            self._local.saved = saved
+
+    def push(self, value):
+        """
+        set the value until the matching pop(). The replaced values are kept
+        in the context too, so one object can be entered by concurrent
+        workers as a context manager.
+        """
+        self._set_saved(self._get_saved() + (self.set(value),))
+
+    def pop(self):
+        """restore the value replaced by the last push()"""
+        saved = self._get_saved()
+        self._set_saved(saved[:-1])
+        self.set(saved[-1])
+
+
+def submit(executor, func, *args, **kw):
+    """
+    Submit func to a thread pool executor, running it in a copy of the
+    current context so it uses the same client and credentials.
+    """
+    if ContextVar is not None:
+        return executor.submit(copy_context().run, func, *args, **kw)
+    return executor.submit(func, *args, **kw)
+
+
+class AccessKeys(MutableMapping):
+    """
+    Credentials sent with every request.
+
+    Keys given to register() are shared by the whole process. Keys set with
+    override() (as SessionToken and MasterKey do) only apply to the current
+    context: the current asyncio task or thread on python 3.7+, the current
+    thread otherwise. Concurrent workers can so act as different users
+    without stepping on each other's credentials.
+    """
+
+    def __init__(self):
+        self._registered = {}
+        self._overrides = ContextLocal('parse_rest_access_keys', default={})
+
+    def _get_overrides(self):
+        return self._overrides.get()
+
+    def _set_overrides(self, overrides):
+        self._overrides.set(overrides)
+
+    def register(self, **kw):
+        """replace the process wide keys"""
+        self._registered = dict(kw)
+
+    def override(self, **kw):
+        """set keys for the current context only, until the matching restore()"""
+        overrides = dict(self._get_overrides())
+        overrides.update(kw)
+        self._overrides.push(overrides)
+
+    def restore(self):
+        """undo the last override() of the current context"""
+        self._overrides.pop()
+
+    def __getitem__(self, key):
+        overrides = self._get_overrides()
+        if key in overrides:
+            return overrides[key]
+        return self._registered[key]
+
+    def __setitem__(self, key, value):
+        self._registered[key] = value
+
+    def __delitem__(self, key):
+        overrides = self._get_overrides()
+        if key in overrides:
+            overrides = dict(overrides)
+            del overrides[key]
+            self._set_overrides(overrides)
+        else:
+            del self._registered[key]
+
+    def __iter__(self):
+        overrides = self._get_overrides()
+        keys = list(overrides)
+        keys.extend(k for k in self._registered if k not in overrides)
+        return iter(keys)
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, dict(self))
+
+
+ACCESS_KEYS = AccessKeys()
 
 
 # Connection can sometimes hang forever on SSL handshake
 CONNECTION_TIMEOUT = 60
 
+# Idle keep-alive connections kept per host, and how long (in seconds) an idle
+# connection may sit in the pool before it is closed instead of reused
+POOL_MAXSIZE = 10
+POOL_IDLE_TIMEOUT = 30
+
+# Requests sent again when a reused connection is closed before any response
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')
+
+# Parse rejects batches of more than 50 requests; bodies are kept well under
+# the server's upload limit. Chunks of a larger batch are sent in parallel.
+BATCH_MAX_REQUESTS = 50
+BATCH_MAX_BYTES = 4 * 1024 * 1024
+BATCH_MAX_WORKERS = 4
+
 
 def register(app_id, rest_key, **kw):
-    global ACCESS_KEYS
-    ACCESS_KEYS = {
-        'app_id': app_id,
-        'rest_key': rest_key
-        }
-    ACCESS_KEYS.update(**kw)
+    ACCESS_KEYS.register(app_id=app_id, rest_key=rest_key, **kw)
 
 
 class SessionToken:
-    def __init__(self, token):
-        global ACCESS_KEYS
+    """
+    act with the given session token in the current context, for requests
+    sent through `client` (by default the current client, see Client)
+    """
+    def __init__(self, token, client=None):
         self.token = token
+        self.client = client
 
     def __enter__(self):
-        ACCESS_KEYS.update({'session_token': self.token})
+        (self.client or current_client()).access_keys.override(session_token=self.token)
 
     def __exit__(self, type, value, traceback):
-        del ACCESS_KEYS['session_token']
+        # blocks are nested, so the current client is the one entered
+        (self.client or current_client()).access_keys.restore()
 
 
 class MasterKey:
-    def __init__(self, master_key):
-        global ACCESS_KEYS
+    """
+    act with the master key in the current context, for requests sent
+    through `client` (by default the current client, see Client)
+    """
+    def __init__(self, master_key, client=None):
         self.master_key = master_key
+        self.client = client
 
     def __enter__(self):
-        return ACCESS_KEYS.update({'master_key': self.master_key})
+        (self.client or current_client()).access_keys.override(master_key=self.master_key)
 
     def __exit__(self, type, value, traceback):
-        del ACCESS_KEYS['master_key']
+        # blocks are nested, so the current client is the one entered
+        (self.client or current_client()).access_keys.restore()
 
 
 def master_key_required(func):
     '''decorator describing methods that require the master key'''
     def ret(obj, *args, **kw):
-        conn = ACCESS_KEYS
+        conn = current_client().access_keys
         if not (conn and conn.get('master_key')):
             message = '%s requires the master key' % func.__name__
             raise core.ParseError(message)
         func(obj, *args, **kw)
     return ret
 
+class _HTTPSConnection(http_client.HTTPSConnection):
+    """HTTPS connection resuming the last TLS session negotiated by its pool"""
+
+    def __init__(self, host, port=None, pool=None, **kw):
+        http_client.HTTPSConnection.__init__(self, host, port, **kw)
+        self._pool = pool
+
+    def connect(self):
+        if not hasattr(ssl.SSLSocket, 'session'):
+            # TLS session reuse needs python 3.6+
+            return http_client.HTTPSConnection.connect(self)
+        http_client.HTTPConnection.connect(self)
+        self.sock = self._context.wrap_socket(
+            self.sock, server_hostname=self._tunnel_host or self.host,
+            session=self._pool._tls_sessions.get(self._session_key))
+        self.remember_session()
+
+    @property
+    def _session_key(self):
+        return (self._tunnel_host or self.host, self._tunnel_port or self.port)
+
+    def remember_session(self):
+        # TLS 1.3 tickets only arrive after the handshake, so this is called
+        # again each time the connection goes back to the pool
+        session = getattr(self.sock, 'session', None)
+        if session is not None:
+            self._pool._tls_sessions[self._session_key] = session
+
+
+def _is_closed(conn):
+    """whether the server has closed an idle connection"""
+    if conn.sock is None:
+        return True
+    try:
+        # an idle connection only becomes readable when it's closed. poll
+        # isn't limited to descriptors below FD_SETSIZE like select is
+        if hasattr(select, 'poll'):
+            poller = select.poll()
+            poller.register(conn.sock, select.POLLIN)
+            return bool(poller.poll(0))
+        return bool(select.select([conn.sock], [], [], 0)[0])
+    except (socket.error, ValueError):
+        return True
+
+
+def _dropped(error):
+    """whether a request failed to be sent because the server closed the connection"""
+    return (not isinstance(error, socket.timeout) and
+            error.errno in (errno.EPIPE, errno.ECONNRESET, errno.ECONNABORTED))
+
+
+def _unanswered(error):
+    """whether the server closed the connection before sending a status line"""
+    if isinstance(error, http_client.BadStatusLine):
+        if hasattr(http_client, 'RemoteDisconnected'):
+            return isinstance(error, http_client.RemoteDisconnected)
+        return error.line == "''"  # python 2
+    return _dropped(error)
+
+
+class ConnectionPool(object):
+    """
+    Persistent keep-alive connections, pooled per (scheme, host, port).
+
+    At most `maxsize` idle connections are kept for each host; connections
+    idle for more than `idle_timeout` seconds are closed instead of reused.
+    All HTTPS connections share one SSL context and resume the last TLS
+    session negotiated with the host, so new connections skip the full
+    handshake.
+    """
+
+    def __init__(self, maxsize=POOL_MAXSIZE, idle_timeout=POOL_IDLE_TIMEOUT,
+                 timeout=CONNECTION_TIMEOUT):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle = {}
+        self._tls_sessions = {}
+        self._lock = threading.Lock()
+        self._ssl_context = ssl.create_default_context()
+
+    def _new_connection(self, scheme, host, port):
+        proxy = getproxies().get(scheme)
+        if proxy and proxy_bypass(host):
+            proxy = None
+        target = urlparse(proxy) if proxy else None
+        if scheme == 'https':
+            conn = _HTTPSConnection(
+                target.hostname if target else host,
+                target.port if target else port,
+                pool=self, timeout=self.timeout, context=self._ssl_context)
+            if target:
+                conn.set_tunnel(host, port)
+        else:
+            conn = http_client.HTTPConnection(
+                target.hostname if target else host,
+                target.port if target else port, timeout=self.timeout)
+        # plain http proxies expect the absolute url as request target
+        conn._absolute_target = bool(target) and scheme == 'http'
+        return conn
+
+    def _get(self, key):
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                conn, released = idle.pop()
+                if time.time() - released <= self.idle_timeout and not _is_closed(conn):
+                    return conn
+                conn.close()
+        return None
+
+    def _put(self, key, conn):
+        if isinstance(conn, _HTTPSConnection):
+            conn.remember_session()
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            idle.append((conn, time.time()))
+            while len(idle) > self.maxsize:
+                idle.pop(0)[0].close()
+
+    def clear(self):
+        """Close every idle connection in the pool"""
+        with self._lock:
+            for idle in self._idle.values():
+                for conn, _ in idle:
+                    conn.close()
+            self._idle = {}
+
+    def urlopen(self, method, url, body=None, headers=None):
+        """
+        Send a request over a pooled connection and return the response
+        status and body. A request that could not be sent on a reused
+        connection the server has meanwhile dropped is retried on a fresh
+        connection, as is an idempotent request the server closed the
+        connection on without answering. Timeouts are never retried.
+        """
+        parts = urlparse(url)
+        scheme = parts.scheme
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, parts.hostname, port)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        target = quote(target, safe="/?&=%:+,;@$!~*'()")
+
+        conn = self._get(key)
+        while True:
+            reused = conn is not None
+            if not reused:
+                conn = self._new_connection(scheme, parts.hostname, port)
+            path = url if conn._absolute_target else target
+            try:
+                try:
+                    conn.request(method, path, body, headers or {})
+                except socket.error as e:
+                    if reused and _dropped(e):
+                        conn.close()
+                        conn = None
+                        continue
+                    raise
+                try:
+                    response = conn.getresponse()
+                except (socket.error, http_client.BadStatusLine) as e:
+                    # the server may have handled the request before closing
+                    # the connection: only resend what can safely be sent twice
+                    if reused and _unanswered(e) and method in IDEMPOTENT_METHODS:
+                        conn.close()
+                        conn = None
+                        continue
+                    raise
+                content = response.read()
+            except Exception:
+                conn.close()
+                raise
+            break
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._put(key, conn)
+        return response.status, content
+
+
+POOL = ConnectionPool()
+
+
+class Client(object):
+    """
+    A Parse application: its API root, its keys and its connection pool.
+
+    Requests are sent with the keys given to register() to the API root
+    read from PARSE_API_ROOT, unless another client is in charge. Models
+    bound to a client with bind() always use it; other requests use the
+    client activated with a `with` block in the current context:
+
+        tenant = Client(app_id, rest_key, api_root='https://tenant.example.com/parse')
+
+        @tenant.bind
+        class GameScore(Object):
+            pass
+
+        with tenant:
+            Installation.Query.all()
+
+    All the ENDPOINT_ROOTs and urls built from API_ROOT are moved onto the
+    client's API root when the request is sent. Query responses are shared
+    through query_cache when one is set (see parse_rest.cache).
+    """
+
+    def __init__(self, app_id=None, rest_key=None, api_root=None, pool=None,
+                 query_cache=None, **kw):
+        self.api_root = (api_root or API_ROOT).rstrip('/')
+        self.pool = pool or ConnectionPool()
+        self.query_cache = query_cache
+        self.access_keys = AccessKeys()
+        if app_id is not None:
+            self.register(app_id, rest_key, **kw)
+
+    def register(self, app_id, rest_key, **kw):
+        self.access_keys.register(app_id=app_id, rest_key=rest_key, **kw)
+
+    def _credentials(self):
+        """what tells apart requests made as different users of this client"""
+        keys = self.access_keys
+        return (self.api_root, keys.get('app_id'), keys.get('session_token'),
+                keys.get('master_key'))
+
+    def bind(self, model_class):
+        """send every request of model_class through this client"""
+        model_class._client = self
+        return model_class
+
+    def url(self, uri):
+        """move an url built from API_ROOT onto this client's API root"""
+        if uri.startswith(API_ROOT) and not uri.startswith(self.api_root):
+            return self.api_root + uri[len(API_ROOT):]
+        return uri
+
+    def __enter__(self):
+        _CURRENT_CLIENT.push(self)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        _CURRENT_CLIENT.pop()
+
+    def __repr__(self):
+        return '<Client:%s>' % self.api_root
+
+
+DEFAULT_CLIENT = Client(pool=POOL)
+DEFAULT_CLIENT.access_keys = ACCESS_KEYS
+
+_CURRENT_CLIENT = ContextLocal('parse_rest_client')
+
+
+def current_client():
+    """the client activated in the current context, or the default one"""
+    return _CURRENT_CLIENT.get() or DEFAULT_CLIENT
+
+
 # Using this as "default=" argument solve the problem with Datetime object not being JSON serializable
 def date_handler(obj):
     return obj.isoformat() if hasattr(obj, 'isoformat') else obj
@@ -80,6 +506,12 @@ def date_handler(obj):
 
 class ParseBase(object):
     ENDPOINT_ROOT = API_ROOT
+    # set by Client.bind
+    _client = None
+
+    @classmethod
+    def _get_client(cls):
+        return cls._client or current_client()
 
     @classmethod
     def execute(cls, uri, http_verb, extra_headers=None, batch=False, _body=None, **kw):
@@ -90,20 +522,54 @@ class ParseBase(object):
         command.
         """
         if batch:
-            urlsplitter = urlparse(API_ROOT).netloc
-            ret = {"method": http_verb, "path": uri.split(urlsplitter, 1)[1]}
+            path = urlparse(cls._get_client().url(uri)).path
+            ret = {"method": http_verb, "path": path}
             if kw:
                 ret["body"] = kw
             return ret
 
-        if not ('app_id' in ACCESS_KEYS and 'rest_key' in ACCESS_KEYS):
+        url, data, headers = cls._prepare_request(
+            uri, http_verb, extra_headers=extra_headers, _body=_body, **kw)
+        status, content = cls._get_client().pool.urlopen(http_verb, url, data, headers)
+        cls._invalidate_queries(http_verb, url, kw)
+        return cls._handle_response(status, content)
+
+    @classmethod
+    def _invalidate_queries(cls, http_verb, url, kw):
+        """drop the cached queries of the classes a request wrote to"""
+        client = cls._get_client()
+        if client.query_cache is None or http_verb == 'GET':
+            return
+        client.query_cache.invalidate(url)
+        root = urlparse(client.api_root)
+        for request in kw.get('requests') or []:
+            client.query_cache.invalidate(
+                '%s://%s%s' % (root.scheme, root.netloc, request['path']))
+
+    @classmethod
+    def aexecute(cls, uri, http_verb, extra_headers=None, _body=None, **kw):
+        """awaitable version of execute, see parse_rest.aio"""
+        from parse_rest import aio
+        return aio.execute(cls, uri, http_verb, extra_headers=extra_headers,
+                           _body=_body, **kw)
+
+    @classmethod
+    def _prepare_request(cls, uri, http_verb, extra_headers=None, _body=None, **kw):
+        """return the url, body and headers of the request to send"""
+        client = cls._get_client()
+        access_keys = client.access_keys
+        if not ('app_id' in access_keys and 'rest_key' in access_keys):
             raise core.ParseError('Missing connection credentials')
 
-        app_id = ACCESS_KEYS.get('app_id')
-        rest_key = ACCESS_KEYS.get('rest_key')
-        master_key = ACCESS_KEYS.get('master_key')
+        app_id = access_keys.get('app_id')
+        rest_key = access_keys.get('rest_key')
+        master_key = access_keys.get('master_key')
+        session_token = access_keys.get('session_token')
 
-        url = uri if uri.startswith(API_ROOT) else cls.ENDPOINT_ROOT + uri
+        if uri.startswith(API_ROOT) or uri.startswith(client.api_root):
+            url = client.url(uri)
+        else:
+            url = client.url(cls.ENDPOINT_ROOT + uri)
         if _body is None:
             data = kw and json.dumps(kw, default=date_handler) or "{}"
         else:
@@ -124,30 +590,26 @@ class ParseBase(object):
         }
         headers.update(extra_headers or {})
 
-        if cls.__name__ == 'File':
-            request = Request(url.encode('utf-8'), data, headers)
-        else:
-            request = Request(url, data, headers)
-
-        if ACCESS_KEYS.get('session_token'):
-            request.add_header('X-Parse-Session-Token', ACCESS_KEYS.get('session_token'))
+        if session_token:
+            headers['X-Parse-Session-Token'] = session_token
         elif master_key:
-            request.add_header('X-Parse-Master-Key', master_key)
+            headers['X-Parse-Master-Key'] = master_key
 
-        request.get_method = lambda: http_verb
+        return url, data, headers
 
-        try:
-            response = urlopen(request, timeout=CONNECTION_TIMEOUT)
-        except HTTPError as e:
+    @staticmethod
+    def _handle_response(status, content):
+        """decode the response JSON, raising the matching error on failure"""
+        if status >= 400:
             exc = {
                 400: core.ResourceRequestBadRequest,
                 401: core.ResourceRequestLoginRequired,
                 403: core.ResourceRequestForbidden,
                 404: core.ResourceRequestNotFound
-                }.get(e.code, core.ParseError)
-            raise exc(e.read())
+                }.get(status, core.ParseError)
+            raise exc(content)
 
-        return json.loads(response.read().decode('utf-8'))
+        return json.loads(content.decode('utf-8'))
 
     @classmethod
     def GET(cls, uri, **kw):
@@ -172,24 +634,125 @@ class ParseBase(object):
 
 
 class ParseBatcher(ParseBase):
-    """Batch together create, update or delete operations"""
+    """
+    Batch together create, update or delete operations.
+
+    Operations are sent in chunks of at most `max_requests` requests and
+    `max_bytes` of JSON, up to `max_workers` chunks at a time. Operations
+    on models bound to different clients are sent in separate batches,
+    each through the client of its models.
+    """
     ENDPOINT_ROOT = '/'.join((API_ROOT, 'batch'))
 
+    def __init__(self, max_requests=BATCH_MAX_REQUESTS, max_bytes=BATCH_MAX_BYTES,
+                 max_workers=BATCH_MAX_WORKERS):
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+
     def batch(self, methods):
         """
         Given a list of create, update or delete methods to call, call all
-        of them in a single batch operation.
+        of them in as few batch operations as the server accepts.
         """
-        methods = list(methods) # methods can be iterator
-        if not methods:
-            #accepts also empty list (or generator) - it allows call batch directly with query result (eventually empty)
+        queries, callbacks, chunks = self._prepare(methods)
+        if not queries:
             return
-        queries, callbacks = list(zip(*[m(batch=True) for m in methods]))
-        # perform all the operations in one batch
-        responses = self.execute("", "POST", requests=queries)
+        # perform all the operations, one batch per chunk
+        if len(chunks) == 1:
+            client, chunk = chunks[0]
+            results = [self._execute_chunk(client, [queries[i] for i in chunk])]
+        else:
+            with ThreadPoolExecutor(min(self.max_workers, len(chunks))) as executor:
+                futures = [submit(executor, self._execute_chunk, client,
+                                  [queries[i] for i in chunk])
+                           for client, chunk in chunks]
+            results = [future.exception() or future.result() for future in futures]
         # perform the callbacks with the response data (updating the existing
         # objets, etc)
+        self._run_chunk_callbacks([chunk for _, chunk in chunks], callbacks, results)
+
+    def _prepare(self, methods):
+        """
+        the queries and callbacks of the operations of methods, and the
+        chunks of query indexes to send together, each with the client of
+        the objects (or classes) its operations are about
+        """
+        queries, callbacks, groups = [], [], []
+        for method in methods:
+            operation = method(batch=True)
+            # methods with nothing to send (like saving an unchanged object) return None
+            if operation is None:
+                continue
+            client = self._client_of(method)
+            indexes = next((g for c, g in groups if c is client), None)
+            if indexes is None:
+                indexes = []
+                groups.append((client, indexes))
+            indexes.append(len(queries))
+            queries.append(operation[0])
+            callbacks.append(operation[1])
+        chunks = []
+        for client, indexes in groups:
+            for chunk in self._chunks([queries[i] for i in indexes]):
+                chunks.append((client, [indexes[i] for i in chunk]))
+        return queries, callbacks, chunks
+
+    def _client_of(self, method):
+        """the client the object or class a batchable method belongs to uses"""
+        owner = getattr(method, '__self__', method)
+        get_client = getattr(owner, '_get_client', None)
+        return get_client() if get_client is not None else self._get_client()
+
+    def _execute_chunk(self, client, queries):
+        with client:
+            return self.execute("", "POST", requests=queries)
+
+    def _chunks(self, queries):
+        """split queries in lists of indexes the server accepts in one batch"""
+        chunks, chunk, size = [], [], 0
+        for i, query in enumerate(queries):
+            # add room for the separating comma
+            query_size = len(json.dumps(query, default=date_handler)) + 1
+            if chunk and (len(chunk) >= self.max_requests or
+                          size + query_size > self.max_bytes):
+                chunks.append(chunk)
+                chunk, size = [], 0
+            chunk.append(i)
+            size += query_size
+        chunks.append(chunk)
+        return chunks
+
+    def abatch(self, methods):
+        """awaitable version of batch, see parse_rest.aio"""
+        from parse_rest import aio
+        return aio.batch(self, methods)
+
+    def _run_chunk_callbacks(self, chunks, callbacks, results):
+        """
+        run the callbacks of every chunk that went through, then raise the
+        first error of a failed chunk, with the errors of the operations of
+        the others in its batch_errors, or the combined errors of all
+        operations
+        """
+        batched_errors = []
+        failure = None
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, BaseException):
+                failure = failure or result
+                continue
+            try:
+                self._run_callbacks([callbacks[i] for i in chunk], result)
+            except core.ParseBatchError as e:
+                batched_errors.extend(e.args[0])
+        if failure is not None:
+            failure.batch_errors = batched_errors
+            raise failure
+        if batched_errors:
+            raise core.ParseBatchError(batched_errors)
 
+    @staticmethod
+    def _run_callbacks(callbacks, responses):
         batched_errors = []
         for callback, response in zip(callbacks, responses):
             if "success" in response:
@@ -207,3 +770,11 @@ class ParseBatcher(ParseBase):
     def batch_delete(self, objects):
         """delete a list of objects in one operation"""
         self.batch(o.delete for o in objects)
+
+    def abatch_save(self, objects):
+        """awaitable version of batch_save"""
+        return self.abatch(o.save for o in objects)
+
+    def abatch_delete(self, objects):
+        """awaitable version of batch_delete"""
+        return self.abatch(o.delete for o in objects)
@@ -0,0 +1,164 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import atexit
+import collections
+import logging
+import threading
+import weakref
+
+from parse_rest.connection import copy_context, ParseBatcher
+from parse_rest.core import ParseBatchError
+from parse_rest.datatypes import Object
+
+
+logger = logging.getLogger(__name__)
+
+
+def _close_at_exit(ref):
+    # registered with a weak reference, so atexit doesn't keep every
+    # aggregator ever created alive
+    aggregator = ref()
+    if aggregator is not None:
+        aggregator.close()
+
+
+class CounterAggregator(object):
+    """
+    Collect increments of counters in memory and send their net value in
+    batches of Increment operations.
+
+    Pending deltas are sent every `flush_interval` seconds from a background
+    thread, as soon as `threshold` counters are pending, when flush() or
+    close() is called and when the process exits. Increments of the same
+    object are sent in one request.
+
+        views = CounterAggregator(flush_interval=10)
+        views.increment(article, 'views')
+        views.add('Article', 'Ed1nuqPvcm', 'likes', 2)
+
+    Counters are only incremented on the server: local values of objects
+    are left as they are. Flushes use the client and credentials of the
+    context the aggregator was created in. Deltas of a batch that could not
+    be sent are kept for the next flush; deltas the server refused are
+    dropped and logged, as are errors of the background thread.
+    """
+
+    def __init__(self, flush_interval=5, threshold=1000, batcher=None):
+        self.flush_interval = flush_interval
+        self.threshold = threshold
+        self.batcher = batcher or ParseBatcher()
+        self._deltas = collections.defaultdict(int)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = None
+        self._context = copy_context() if copy_context is not None else None
+        atexit.register(_close_at_exit, weakref.ref(self))
+
+    def __len__(self):
+        return len(self._deltas)
+
+    def increment(self, obj, key, amount=1):
+        """increment a counter of a saved object"""
+        self.add(obj.__class__.__name__, obj.objectId, key, amount)
+
+    def add(self, class_name, object_id, key, amount=1):
+        """increment the counter `key` of the object of the given class and id"""
+        with self._lock:
+            self._deltas[(class_name, object_id, key)] += amount
+            due = len(self._deltas) >= self.threshold
+            if self._thread is None and self.flush_interval and not self._closed:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+        if due:
+            if self._thread is not None:
+                self._wakeup.set()
+            else:
+                self.flush()
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if not self._closed:
+                try:
+                    self.flush()
+                except Exception:
+                    # deltas that weren't sent are kept for the next flush
+                    logger.exception('Could not flush counters')
+
+    def flush(self):
+        """send every pending delta"""
+        if self._context is not None:
+            # a context can only be entered by one thread at a time
+            return self._context.copy().run(self._flush)
+        return self._flush()
+
+    def _flush(self):
+        with self._flush_lock:
+            with self._lock:
+                deltas, self._deltas = self._deltas, collections.defaultdict(int)
+            by_object = collections.OrderedDict()
+            for (class_name, object_id, key), amount in deltas.items():
+                if amount:
+                    by_object.setdefault((class_name, object_id), {})[key] = amount
+            sent = set()
+            try:
+                self.batcher.batch(self._update(class_name, object_id, amounts, sent)
+                                   for (class_name, object_id), amounts
+                                   in by_object.items())
+            except ParseBatchError as e:
+                # every batch went through: updates the server refused (like
+                # those of deleted objects) would be refused again
+                logger.error('Dropped the counters of %d objects: %s',
+                             len(by_object) - len(sent), e.args[0])
+                sent.update(by_object)
+            finally:
+                # keep what didn't go through for the next flush
+                with self._lock:
+                    for (class_name, object_id), amounts in by_object.items():
+                        if (class_name, object_id) not in sent:
+                            for key, amount in amounts.items():
+                                self._deltas[(class_name, object_id, key)] += amount
+
+    @staticmethod
+    def _update(class_name, object_id, amounts, sent):
+        """batchable method incrementing the counters of one object"""
+        klass = Object.factory(class_name)
+
+        def update(batch=True):
+            operations = dict((key, {'__op': 'Increment', 'amount': amount})
+                              for key, amount in amounts.items())
+            query = klass.PUT('/'.join([klass.ENDPOINT_ROOT, object_id]),
+                              batch=True, **operations)
+            return query, lambda response: sent.add((class_name, object_id))
+        # lets the batcher send the update through the client of the class
+        update._get_client = klass._get_client
+        return update
+
+    def close(self):
+        """stop the background thread and send every pending delta"""
+        self._closed = True
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
@@ -14,12 +14,14 @@ from __future__ import unicode_literals
 
 import base64
 import datetime
+import json
 import mimetypes
 import six
 
-from parse_rest.connection import API_ROOT, ParseBase
+from parse_rest.connection import API_ROOT, ParseBase, date_handler
 from parse_rest.query import QueryManager
 from parse_rest.core import ParseError
+from parse_rest.unitofwork import current_identity_map, current_unit_of_work
 
 
 def complex_type(name=None):
@@ -61,21 +63,24 @@ class ParseType(object):
                          for k, v in python_object._editable_attrs.items()
                          ])
 
-        python_type = ParseResource if is_object else type(python_object)
+        if is_object:
+            # checked first: probing an unloaded object for __iter__ would load it
+            return Pointer(python_object)._to_native()
+
+        python_type = type(python_object)
 
         # classes that need to be cast to a different type before serialization
         transformation_map = {
             datetime.datetime: Date,
-            ParseResource: Pointer
         }
 
         if (hasattr(python_object, '__iter__') and
             not isinstance(python_object, (six.string_types[0], ParseType))):
             # It's an iterable? Repeat this whole process on each object
             if isinstance(python_object, dict):
-                for key, value in python_object.items():
-                    python_object[key]=ParseType.convert_to_parse(value, as_pointer=as_pointer)
-                return python_object
+                # build a new dict, the object's own attribute must not change
+                return dict([(key, ParseType.convert_to_parse(value, as_pointer=as_pointer))
+                             for key, value in python_object.items()])
             else:
                 return [ParseType.convert_to_parse(o, as_pointer=as_pointer)
                     for o in python_object]
@@ -104,6 +109,9 @@ class Pointer(ParseType):
     def from_native(cls, **kw):
         # create object with only objectId and unloaded flag. it is automatically loaded when any other field is accessed
         klass = Object.factory(kw.get('className'))
+        identity_map = current_identity_map()
+        if identity_map is not None:
+            return identity_map.pointer(klass, kw.get('objectId'))
         return klass(objectId=kw.get('objectId'), _is_loaded=False)
 
 
@@ -123,7 +131,7 @@ class EmbeddedObject(ParseType):
     @classmethod
     def from_native(cls, **kw):
         klass = Object.factory(kw.pop('className'))
-        return klass(**kw)
+        return klass._from_server(kw)
 
 
 @complex_type('Relation')
@@ -436,6 +444,10 @@ class ParseResource(ParseBase):
 
     PROTECTED_ATTRIBUTES = ['objectId', 'createdAt', 'updatedAt']
 
+    # groups of fields loaded together when one of them was deferred,
+    # e.g. [('body', 'summary')]
+    DEFERRED_GROUPS = []
+
     @property
     def _editable_attrs(self):
         protected_attrs = self.__class__.PROTECTED_ATTRIBUTES
@@ -448,11 +460,96 @@ class ParseResource(ParseBase):
 
     def __getattr__(self, attr):
         # if object is not loaded and attribute is missing, try to load it
-        if not self.__dict__.get('_is_loaded', True):
+        # (special methods looked up by python are never fields)
+        if not self.__dict__.get('_is_loaded', True) and not attr.startswith('__'):
             del self._is_loaded
-            self._init_attrs(self.GET(self._absolute_url))
+            self._load(self.GET(self._absolute_url))
+        elif not attr.startswith('_') and self._is_deferred(attr):
+            # partially loaded: fetch only the missing field (and its group)
+            self._load_fields(self._deferred_group(attr))
         return object.__getattribute__(self, attr) #preserve default if attr not exists
 
+    def _is_deferred(self, attr):
+        fetched = self.__dict__.get('_fetched_fields')
+        if fetched is not None and attr not in fetched:
+            return True
+        return attr in self.__dict__.get('_deferred_fields', ())
+
+    def _deferred_group(self, attr):
+        for group in self.DEFERRED_GROUPS:
+            if attr in group:
+                return [f for f in group if f == attr or
+                        (f not in self.__dict__ and self._is_deferred(f))]
+        return [attr]
+
+    def refresh(self, keys=None):
+        """
+        reload the object (or only some keys) from Parse, dropping local
+        changes of the reloaded attributes
+        """
+        params = {'keys': ','.join(keys)} if keys else {}
+        self._refresh(self.GET(self._absolute_url, **params), keys)
+
+    @classmethod
+    def refresh_all(cls, objects, keys=None):
+        """
+        reload many objects (or only some keys) with a few concurrent
+        objectId queries per class, updating them in place. Objects not
+        found on Parse are left as they are.
+        """
+        from parse_rest.query import RESOLVE_CHUNK_SIZE, _load_all
+        _load_all([o for o in objects if o.objectId], RESOLVE_CHUNK_SIZE,
+                  keys=keys, refresh=True)
+
+    def _refresh(self, data, keys=None):
+        if keys:
+            data = dict((k, v) for k, v in data.items() if k in keys or k == 'objectId')
+            self.__dict__.get('_deferred_fields', set()).difference_update(keys)
+            if '_fetched_fields' in self.__dict__:
+                self._fetched_fields.update(keys)
+        else:
+            # attributes deleted on the server go away, nothing is deferred anymore
+            for key in list(self._editable_attrs):
+                if key not in data:
+                    del self.__dict__[key]
+            self.__dict__.pop('_deferred_fields', None)
+            self.__dict__.pop('_fetched_fields', None)
+            self._snapshot = {}
+        for key in data:
+            self.__dict__.get('_pending_operations', {}).pop(key, None)
+        self._load(data)
+
+    def _defer_fields(self, deferred=None, fetched=None):
+        """remember the fields a partial query left out"""
+        if deferred is not None:
+            self._deferred_fields = set(f for f in deferred if f not in self.__dict__)
+        if fetched is not None:
+            self._fetched_fields = set(fetched) | set(self.__dict__)
+
+    def _load_fields(self, fields):
+        """fetch some fields of a partially loaded object"""
+        self.refresh(keys=fields)
+
+    def _load(self, data):
+        """fill an unloaded object with its attributes fetched from Parse"""
+        self.__dict__.pop('_is_loaded', None)
+        self._init_attrs(data)
+        self._mark_clean(*data)
+
+    @classmethod
+    def _from_server(cls, data):
+        """build an instance from attributes returned by Parse"""
+        identity_map = current_identity_map()
+        if identity_map is not None and data.get('objectId'):
+            obj = identity_map.merge(cls, data)
+            if obj is not None:
+                return obj
+        obj = cls(**data)
+        obj._mark_clean()
+        if identity_map is not None and obj.objectId:
+            identity_map.add(obj)
+        return obj
+
     def _init_attrs(self, args):
         for key, value in six.iteritems(args):
             # https://github.com/milesrichardson/ParsePy/issues/155
@@ -464,6 +561,89 @@ class ParseResource(ParseBase):
     def _to_native(self):
         return ParseType.convert_to_parse(self)
 
+    @staticmethod
+    def _encode_native(value):
+        return json.dumps(value, sort_keys=True, default=date_handler)
+
+    def _remember(self, encoded):
+        """
+        update the server state the object is compared to with a dict of
+        encoded attributes, None meaning the attribute doesn't exist
+        """
+        snapshot = dict(self.__dict__.get('_snapshot') or {})
+        for key, value in encoded.items():
+            if value is None:
+                snapshot.pop(key, None)
+            else:
+                snapshot[key] = value
+        self._snapshot = snapshot
+
+    def _mark_clean(self, *keys):
+        """
+        remember the current value of the given attributes, or of all of
+        them, as the one stored on the server
+        """
+        native = self._to_native()
+        if not keys:
+            self._snapshot = {}
+            keys = native.keys()
+        self._remember(dict([(k, self._encode_native(native[k]) if k in native else None)
+                             for k in keys]))
+
+    def _mark_saved(self, payload):
+        """remember the attributes sent to the server by a save"""
+        self._remember(dict([
+            (k, None if isinstance(v, dict) and v.get('__op') == 'Delete'
+             else self._encode_native(v))
+            for k, v in payload.items()]))
+
+    @staticmethod
+    def _merge_operations(key, previous, operation):
+        """combine two atomic operations on the same key into one"""
+        kind = operation['__op']
+        if previous['__op'] != kind:
+            raise ParseError("Can't combine a pending %s with a %s on '%s', save() first"
+                             % (previous['__op'], kind, key))
+        if kind == 'Increment':
+            return {'__op': kind, 'amount': previous['amount'] + operation['amount']}
+        if kind in ('Add', 'AddRelation', 'RemoveRelation'):
+            return {'__op': kind, 'objects': previous['objects'] + operation['objects']}
+        if kind in ('AddUnique', 'Remove'):
+            objects = previous['objects']
+            return {'__op': kind, 'objects': objects + [x for x in operation['objects']
+                                                        if x not in objects]}
+        return operation
+
+    def _defer_operation(self, key, operation):
+        """record an atomic operation to send with the next save"""
+        pending = self.__dict__.setdefault('_pending_operations', {})
+        if key in pending:
+            operation = self._merge_operations(key, pending[key], operation)
+        pending[key] = operation
+
+    def _sent_operations(self, sent):
+        """forget pending operations sent by a save, unless they were changed since"""
+        pending = self.__dict__.get('_pending_operations', {})
+        for key, operation in sent.items():
+            if pending.get(key) is operation:
+                del pending[key]
+            self._mark_clean(key)
+
+    def _changed_native(self):
+        """
+        attributes changed since the object was loaded or saved, as they are
+        sent to Parse. Objects not known to the server send everything.
+        """
+        native = self._to_native()
+        snapshot = self.__dict__.get('_snapshot')
+        if snapshot is None:
+            return native
+        changed = dict([(k, v) for k, v in native.items()
+                        if snapshot.get(k) != self._encode_native(v)])
+        for key in snapshot:
+            if key not in native:
+                changed[key] = {'__op': 'Delete'}
+        return changed
 
     def _get_updated_datetime(self):
         return self.__dict__.get('_updated_at') and self._updated_at._date
@@ -478,6 +658,10 @@ class ParseResource(ParseBase):
         self._created_at = Date(value)
 
     def save(self, batch=False):
+        if not batch:
+            unit_of_work = current_unit_of_work()
+            if unit_of_work is not None:
+                return unit_of_work.save(self)
         if self.objectId:
             return self._update(batch=batch)
         else:
@@ -485,11 +669,24 @@ class ParseResource(ParseBase):
 
     def _create(self, batch=False):
         uri = self.__class__.ENDPOINT_ROOT
-        response = self.__class__.POST(uri, batch=batch, **self._to_native())
+        payload = self._to_native()
+        # pending operations are already applied to the local values, except
+        # relation changes which have no local value to send
+        operations = dict(self.__dict__.get('_pending_operations', {}))
+        relations = dict([(k, op) for k, op in operations.items()
+                          if op['__op'] in ('AddRelation', 'RemoveRelation')])
+        saved = dict(payload)
+        payload.update(relations)
+        response = self.__class__.POST(uri, batch=batch, **payload)
 
         def call_back(response_dict):
             self.createdAt = self.updatedAt = response_dict['createdAt']
             self.objectId = response_dict['objectId']
+            self._mark_saved(saved)
+            self._sent_operations(operations)
+            identity_map = current_identity_map()
+            if identity_map is not None:
+                identity_map.add(self)
 
         if batch:
             return response, call_back
@@ -497,10 +694,20 @@ class ParseResource(ParseBase):
             call_back(response)
 
     def _update(self, batch=False):
-        response = self.__class__.PUT(self._absolute_url, batch=batch, **self._to_native())
+        payload = self._changed_native()
+        # keys with pending operations send the operation, not their value
+        operations = dict(self.__dict__.get('_pending_operations', {}))
+        saved = dict([(k, v) for k, v in payload.items() if k not in operations])
+        payload.update(operations)
+        if not payload:
+            # nothing changed, nothing to send
+            return None
+        response = self.__class__.PUT(self._absolute_url, batch=batch, **payload)
 
         def call_back(response_dict):
             self.updatedAt = response_dict['updatedAt']
+            self._mark_saved(saved)
+            self._sent_operations(operations)
 
         if batch:
             return response, call_back
@@ -508,10 +715,24 @@ class ParseResource(ParseBase):
             call_back(response)
 
     def delete(self, batch=False):
+        if not batch:
+            unit_of_work = current_unit_of_work()
+            if unit_of_work is not None:
+                return unit_of_work.delete(self)
         response = self.__class__.DELETE(self._absolute_url, batch=batch)
         if batch:
             return response, lambda response_dict: None
 
+    def asave(self):
+        """awaitable version of save, see parse_rest.aio"""
+        from parse_rest import aio
+        return aio.run(self.save)
+
+    def adelete(self):
+        """awaitable version of delete, see parse_rest.aio"""
+        from parse_rest import aio
+        return aio.run(self.delete)
+
     @property
     def className(self):
         return self.__class__.__name__
@@ -595,53 +816,58 @@ class Object(six.with_metaclass(ObjectMetaclass, ParseResource)):
     def as_pointer(self):
         return Pointer(self)
 
-    def increment(self, key, amount=1):
+    def _operate(self, key, operation, apply_locally, defer):
+        """
+        Send an atomic operation on one key, then apply it to the local
+        value. A deferred operation (always the case inside a UnitOfWork)
+        is only recorded: it is sent by the next save() of the object,
+        together with its other changes.
+        """
+        unit_of_work = current_unit_of_work()
+        if defer or unit_of_work is not None:
+            self._defer_operation(key, operation)
+            apply_locally()
+            if unit_of_work is not None:
+                unit_of_work.save(self)
+        else:
+            self.__class__.PUT(self._absolute_url, **{key: operation})
+            apply_locally()
+            self._mark_clean(key)
+
+    def increment(self, key, amount=1, defer=False):
         """
         Increment one value in the object. Note that this happens immediately:
-        it does not wait for save() to be called
+        it does not wait for save() to be called, unless defer is True.
+        Deferred increments of the same key add up.
         """
-        payload = {
-            key: {
-                '__op': 'Increment',
-                'amount': amount
-                }
-            }
-        self.__class__.PUT(self._absolute_url, **payload)
-        self.__dict__[key] += amount
+        def apply_locally():
+            self.__dict__[key] = self.__dict__.get(key, 0) + amount
+        self._operate(key, {'__op': 'Increment', 'amount': amount},
+                      apply_locally, defer)
 
-    def remove(self, key):
+    def remove(self, key, defer=False):
         """
         Clear a column value in the object. Note that this happens immediately:
-        it does not wait for save() to be called.
+        it does not wait for save() to be called, unless defer is True.
         """
-        payload = {
-            key: {
-                '__op': 'Delete'
-                }
-            }
-        self.__class__.PUT(self._absolute_url, **payload)
-        del self.__dict__[key]
+        self._operate(key, {'__op': 'Delete'},
+                      lambda: self.__dict__.pop(key, None), defer)
 
-    def removeRelation(self, key, className, objectsId):
-        self.manageRelation('RemoveRelation', key, className, objectsId)
+    def removeRelation(self, key, className, objectsId, defer=False):
+        self.manageRelation('RemoveRelation', key, className, objectsId, defer=defer)
 
-    def addRelation(self, key, className, objectsId):
-        self.manageRelation('AddRelation', key, className, objectsId)
+    def addRelation(self, key, className, objectsId, defer=False):
+        self.manageRelation('AddRelation', key, className, objectsId, defer=defer)
 
-    def manageRelation(self, action, key, className, objectsId):
+    def manageRelation(self, action, key, className, objectsId, defer=False):
         objects = [{
                     "__type": "Pointer",
                     "className": className,
                     "objectId": objectId
                     } for objectId in objectsId]
 
-        payload = {
-            key: {
-                 "__op": action,
-                 "objects": objects
-                }
-            }
-        self.__class__.PUT(self._absolute_url, **payload)
+        self._operate(key, {"__op": action, "objects": objects},
+                      lambda: None, defer)
 
     def relation(self, key):
         if not hasattr(self, key):
@@ -651,30 +877,21 @@ class Object(six.with_metaclass(ObjectMetaclass, ParseResource)):
         except:
             raise ParseError("Column '%s' is not a Relation." % (key,))
 
-    def addToArray(self, key, objects):
-        payload = {
-            key: {
-                '__op': 'Add', 'objects': objects
-                }
-            }
-        self.__class__.PUT(self._absolute_url, **payload)
-        self.__dict__[key] = self.__dict__.get(key, []) + objects
-
-    def addUniqueToArray(self, key, objects):
-        payload = {
-            key: {
-                '__op': 'AddUnique', 'objects': objects
-                }
-            }
-        self.__class__.PUT(self._absolute_url, **payload)
-        data = self.__dict__.get(key, [])
-        self.__dict__[key] = data + [x for x in objects if x not in data]
-
-    def removeFromArray(self, key, objects):
-        payload = {
-            key: {
-                '__op': 'Remove', 'objects': objects
-                }
-            }
-        self.__class__.PUT(self._absolute_url, **payload)
-        self.__dict__[key] = [x for x in self.__dict__.get(key, []) if x not in objects]
+    def addToArray(self, key, objects, defer=False):
+        def apply_locally():
+            self.__dict__[key] = self.__dict__.get(key, []) + objects
+        self._operate(key, {'__op': 'Add', 'objects': objects},
+                      apply_locally, defer)
+
+    def addUniqueToArray(self, key, objects, defer=False):
+        def apply_locally():
+            data = self.__dict__.get(key, [])
+            self.__dict__[key] = data + [x for x in objects if x not in data]
+        self._operate(key, {'__op': 'AddUnique', 'objects': objects},
+                      apply_locally, defer)
+
+    def removeFromArray(self, key, objects, defer=False):
+        def apply_locally():
+            self.__dict__[key] = [x for x in self.__dict__.get(key, []) if x not in objects]
+        self._operate(key, {'__op': 'Remove', 'objects': objects},
+                      apply_locally, defer)
@@ -0,0 +1,153 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import threading
+
+from parse_rest.connection import ContextLocal
+from parse_rest.query import RESOLVE_CHUNK_SIZE, QueryResourceDoesNotExist
+
+
+_CURRENT_LOADERS = ContextLocal('parse_rest_loaders', {})
+
+
+def current_loader(model_class):
+    """the ObjectLoader of model_class active in the current context, if any"""
+    return _CURRENT_LOADERS.get().get(model_class)
+
+
+class _Batch(object):
+
+    def __init__(self):
+        self.ids = []
+        self.results = None
+        self.error = None
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+
+class ObjectLoader(object):
+    """
+    Load objects of a class by objectId, coalescing lookups.
+
+    Lookups made by different threads within `window` seconds of each
+    other, or by different tasks in the same event loop iteration with
+    aload(), are sent as one objectId $in query of at most `max_batch`
+    ids. Loaded objects are kept by the loader, so a loader is meant to
+    live as long as one request or job:
+
+        with ObjectLoader(Player) as players:
+            # Player.Query.get(objectId=...) goes through the loader here
+            futures = [submit(executor, Player.Query.get, objectId=i) for i in ids]
+            player = players.load(some_id)
+
+    Lookups made with different credentials are never batched or cached
+    together. The same instance is returned to every caller asking for an
+    object.
+    """
+
+    def __init__(self, model_class, window=0.005, max_batch=RESOLVE_CHUNK_SIZE):
+        self.model_class = model_class
+        self.window = window
+        self.max_batch = max_batch
+        self._cache = {}
+        self._batches = {}
+        self._async_batches = {}
+        self._lock = threading.Lock()
+
+    def _credentials(self):
+        return self.model_class._get_client()._credentials()
+
+    def _result(self, credentials, object_id):
+        obj = self._cache.get((credentials, object_id))
+        if obj is None:
+            raise QueryResourceDoesNotExist(
+                'No %s with objectId %s' % (self.model_class.__name__, object_id),
+                status_code=404)
+        return obj
+
+    def _fetch(self, credentials, ids):
+        """send the query of a batch and remember its results"""
+        manager = self.model_class.Query
+        results = manager._materialize(manager._fetch_raw(
+            where=json.dumps({'objectId': {'$in': ids}}), limit=len(ids)))
+        self._store(credentials, results)
+
+    def _store(self, credentials, objects):
+        with self._lock:
+            for obj in objects:
+                self._cache[(credentials, obj.objectId)] = obj
+
+    def load(self, object_id):
+        """the object with this objectId, raising QueryResourceDoesNotExist if there is none"""
+        credentials = self._credentials()
+        with self._lock:
+            if (credentials, object_id) in self._cache:
+                return self._cache[(credentials, object_id)]
+            batch = self._batches.get(credentials)
+            leader = batch is None
+            if leader:
+                batch = self._batches[credentials] = _Batch()
+            if object_id not in batch.ids:
+                batch.ids.append(object_id)
+            if len(batch.ids) >= self.max_batch:
+                # later lookups go in a new batch
+                del self._batches[credentials]
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._batches.get(credentials) is batch:
+                    del self._batches[credentials]
+            try:
+                self._fetch(credentials, batch.ids)
+            except Exception as e:
+                batch.error = e
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        return self._result(credentials, object_id)
+
+    def load_many(self, object_ids):
+        """the objects with these objectIds, in as few queries as possible"""
+        credentials = self._credentials()
+        with self._lock:
+            missing = [i for i in object_ids if (credentials, i) not in self._cache]
+        missing = list(dict.fromkeys(missing))
+        for i in range(0, len(missing), self.max_batch):
+            self._fetch(credentials, missing[i:i + self.max_batch])
+        return [self._result(credentials, i) for i in object_ids]
+
+    def aload(self, object_id):
+        """awaitable version of load, see parse_rest.aio"""
+        from parse_rest import aio
+        return aio.load(self, object_id)
+
+    def clear(self):
+        """forget every loaded object"""
+        with self._lock:
+            self._cache.clear()
+
+    def __enter__(self):
+        loaders = dict(_CURRENT_LOADERS.get())
+        loaders[self.model_class] = self
+        _CURRENT_LOADERS.push(loaders)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        _CURRENT_LOADERS.pop()
@@ -14,6 +14,22 @@
 import json
 import copy
 import collections
+import re
+import string
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+import six
+from six.moves import queue
+
+from parse_rest.connection import API_ROOT, BATCH_MAX_WORKERS, date_handler, submit
+
+
+# characters of generated objectIds, in sort order
+OBJECT_ID_ALPHABET = string.digits + string.ascii_uppercase + string.ascii_lowercase
+
+# objectIds per query when resolving pointers
+RESOLVE_CHUNK_SIZE = 100
 
 
 class QueryError(Exception):
@@ -35,30 +51,339 @@ class QueryResourceMultipleResultsReturned(QueryError):
     pass
 
 
+def _put(buffer, item, stop):
+    """put item in a bounded buffer, unless the consumer stopped waiting"""
+    while not stop.is_set():
+        try:
+            buffer.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _feed(pages, buffer, stop):
+    """
+    Put every page in the buffer as (page, None), then (None, error) with
+    the error raised while fetching them, if any.
+    """
+    error = None
+    try:
+        for page in pages:
+            if not _put(buffer, (page, None), stop):
+                return
+    except Exception as e:
+        error = e
+    _put(buffer, (None, error), stop)
+
+
+class Q(object):
+    """
+    Filters that can be combined: `|` matches either side ($or), `&` both
+    ($and) and `~` negates ($nor).
+
+        GameScore.Query.filter(Q(score__gt=1000) | Q(player_name='Sean Plott'))
+    """
+    AND = '$and'
+    OR = '$or'
+    NOR = '$nor'
+
+    def __init__(self, **kw):
+        self.filters = kw
+        self.connector = None
+        self.children = []
+
+    @classmethod
+    def _combine(cls, connector, children):
+        q = cls()
+        q.connector = connector
+        for child in children:
+            if not isinstance(child, Q):
+                raise TypeError('Only Q objects can be combined, not %r' % (child,))
+            if child.connector == connector and connector != cls.NOR:
+                q.children.extend(child.children)
+            else:
+                q.children.append(child)
+        return q
+
+    def __or__(self, other):
+        return self._combine(self.OR, [self, other])
+
+    def __and__(self, other):
+        return self._combine(self.AND, [self, other])
+
+    def __invert__(self):
+        return self._combine(self.NOR, [self])
+
+    def _compile(self):
+        """the where clause of the filters"""
+        if self.connector is None:
+            return dict(Queryset._compile_filters(self.filters, collections.defaultdict(dict)))
+        return {self.connector: [child._compile() for child in self.children]}
+
+    def __repr__(self):
+        if self.connector is None:
+            return 'Q(%s)' % ', '.join('%s=%r' % item for item in sorted(self.filters.items()))
+        return '<Q %s %r>' % (self.connector, self.children)
+
+
+class Aggregate(object):
+    """a value computed over each group of Queryset.group_by"""
+    OPERATOR = None
+
+    def __init__(self, field):
+        self.field = field
+
+    def _to_native(self):
+        return {self.OPERATOR: '$' + self.field}
+
+
+class Sum(Aggregate):
+    OPERATOR = '$sum'
+
+
+class Avg(Aggregate):
+    OPERATOR = '$avg'
+
+
+class Min(Aggregate):
+    OPERATOR = '$min'
+
+
+class Max(Aggregate):
+    OPERATOR = '$max'
+
+
+class Count(Aggregate):
+    """number of objects in each group"""
+
+    def __init__(self):
+        super(Count, self).__init__(None)
+
+    def _to_native(self):
+        return {'$sum': 1}
+
+
+class P(object):
+    """placeholder for a filter value given when a QueryTemplate is run"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return 'P(%r)' % self.name
+
+
+# how placeholders appear in the where JSON of a template
+_PLACEHOLDER = '\x00P:%s\x00'
+_PLACEHOLDER_JSON = re.compile(r'"\\u0000P:(.*?)\\u0000"')
+
+
+class QueryTemplate(object):
+    """
+    A query compiled once and run with different values. Filters are
+    parsed and the where JSON is encoded when the template is built; a run
+    only encodes the bound values:
+
+        best = GameScore.Query.filter(player_name=P('name')).order_by('-score').template()
+        best.first(name='John Doe')
+        best.fetch(name='Jane Doe')
+    """
+
+    def __init__(self, queryset):
+        self._queryset = queryset
+        self._manager = queryset._manager
+        where = json.dumps(queryset._where, default=self._encode_placeholder)
+        # literal JSON, then placeholder names and literal JSON in turn
+        self._parts = _PLACEHOLDER_JSON.split(where) if queryset._where else None
+        self._names = set(self._parts[1::2]) if self._parts else set()
+        self._options = queryset._query_options_without_where()
+
+    @staticmethod
+    def _encode_placeholder(value):
+        if isinstance(value, P):
+            return _PLACEHOLDER % value.name
+        return date_handler(value)
+
+    def _where(self, params):
+        if set(params) != self._names:
+            raise QueryError('Template expects values for %s, got %s'
+                             % (sorted(self._names), sorted(params)))
+        parts = list(self._parts)
+        for i in range(1, len(parts), 2):
+            value = Queryset.convert_to_parse(params[parts[i]])
+            parts[i] = json.dumps(value, default=date_handler)
+        return ''.join(parts)
+
+    def _run(self, params, **options):
+        query = dict(self._options, **options)
+        if self._parts is not None:
+            query['where'] = self._where(params)
+        return query
+
+    def fetch(self, **params):
+        """the objects matching the query with these values"""
+        return self._queryset._materialize(self._manager._fetch_raw(**self._run(params)))
+
+    def get(self, **params):
+        limit = min(self._options.get('limit', 2), 2)
+        results = self._manager._fetch_raw(**self._run(params, limit=limit))
+        return self._queryset._get_single(self._queryset._materialize(results))
+
+    def first(self, **params):
+        limit = min(self._options.get('limit', 1), 1)
+        results = self._queryset._materialize(
+            self._manager._fetch_raw(**self._run(params, limit=limit)))
+        return results[0] if results else None
+
+    def count(self, **params):
+        options = self._run(params, limit=0)
+        options.pop('include', None)
+        return self._manager._count(**options)
+
+
+def resolve_pointers(objects, paths, chunk_size=RESOLVE_CHUNK_SIZE):
+    """
+    Load the objects pointed to by the given paths ('player',
+    'game.creator'...) of a list of objects, with one query per class and
+    chunk_size objects instead of one request per object. Pointers are
+    filled in place; lists of pointers are followed too.
+    """
+    from parse_rest.datatypes import ParseResource
+    for path in paths:
+        current = list(objects)
+        for name in path.split('.'):
+            values = []
+            for obj in current:
+                value = obj.__dict__.get(name)
+                for item in (value if isinstance(value, list) else [value]):
+                    if isinstance(item, ParseResource):
+                        values.append(item)
+            _load_all([v for v in values if not v.__dict__.get('_is_loaded', True)],
+                      chunk_size)
+            current = values
+
+
+def _load_all(objects, chunk_size, keys=None, refresh=False, max_workers=BATCH_MAX_WORKERS):
+    """
+    load objects with objectId $in queries of chunk_size ids per class, up
+    to max_workers queries at a time. With refresh, loaded objects are
+    updated as well, and only keys are fetched if given.
+    """
+    groups = collections.OrderedDict()
+    for obj in objects:
+        instances = groups.setdefault(obj.__class__, collections.OrderedDict())
+        instances.setdefault(obj.objectId, []).append(obj)
+    chunks = []
+    for klass, instances in groups.items():
+        ids = list(instances)
+        chunks.extend((klass, ids[i:i + chunk_size]) for i in range(0, len(ids), chunk_size))
+    if not chunks:
+        return
+
+    def fetch(klass, chunk):
+        options = {'where': json.dumps({'objectId': {'$in': chunk}}), 'limit': len(chunk)}
+        if keys:
+            options['keys'] = ','.join(keys)
+        if refresh:
+            # like refresh(), never served by the query cache
+            return klass.GET(klass.ENDPOINT_ROOT, **options).get('results')
+        return klass.Query._fetch_raw(**options)
+
+    if len(chunks) == 1:
+        responses = [fetch(*chunks[0])]
+    else:
+        with ThreadPoolExecutor(min(max_workers, len(chunks))) as executor:
+            futures = [submit(executor, fetch, klass, chunk) for klass, chunk in chunks]
+        responses = [future.result() for future in futures]
+
+    # instances are updated here, not in the worker threads
+    for (klass, chunk), results in zip(chunks, responses):
+        for data in results:
+            for obj in groups[klass].get(data['objectId'], []):
+                # decoding consumes the data, each instance needs its own
+                data_copy = copy.deepcopy(data)
+                if refresh:
+                    obj._refresh(data_copy, keys)
+                else:
+                    obj._load(data_copy)
+
+
 class QueryManager(object):
 
     def __init__(self, model_class):
         self.model_class = model_class
 
     def _fetch(self, **kw):
+        return self._materialize(self._fetch_raw(**kw))
+
+    def _fetch_raw(self, **kw):
+        return self._query(**kw).get('results')
+
+    def _query(self, **kw):
+        """send a query, through the client's query cache if it has one"""
         klass = self.model_class
         uri = self.model_class.ENDPOINT_ROOT
-        return [klass(**it) for it in klass.GET(uri, **kw).get('results')]
+        cache = klass._get_client().query_cache
+        if cache is None:
+            return klass.GET(uri, **kw)
+        return cache.fetch(klass, kw, lambda: klass.GET(uri, **kw))
+
+    def _materialize(self, results):
+        klass = self.model_class
+        return [klass._from_server(it) for it in results]
 
     def _count(self, **kw):
         kw.update({"count": 1})
-        return self.model_class.GET(self.model_class.ENDPOINT_ROOT, **kw).get('count')
+        return self._query(**kw).get('count')
 
     def all(self):
         return Queryset(self)
 
-    def filter(self, **kw):
-        return self.all().filter(**kw)
+    def filter(self, *conditions, **kw):
+        return self.all().filter(*conditions, **kw)
 
     def fetch(self):
         return self.all().fetch()
 
+    def parallel_scan(self, **kw):
+        return self.all().parallel_scan(**kw)
+
+    def template(self, *conditions, **kw):
+        return self.all().template(*conditions, **kw)
+
+    # class names of the classes with their own endpoint
+    SYSTEM_CLASSES = {'users': '_User', 'roles': '_Role', 'installations': '_Installation'}
+
+    def _class_name(self):
+        name = self.model_class.ENDPOINT_ROOT.rstrip('/').rsplit('/', 1)[-1]
+        return self.SYSTEM_CLASSES.get(name, name)
+
+    def _aggregate(self, **kw):
+        klass = self.model_class
+        uri = '/'.join([API_ROOT, 'aggregate', self._class_name()])
+        return klass.GET(uri, **kw).get('results')
+
+    def aggregate(self, pipeline):
+        """
+        run an aggregation pipeline ($match, $group, $project, $sort...) on
+        the server and return its raw results. This needs the master key.
+        """
+        return self._aggregate(pipeline=json.dumps(pipeline, default=date_handler))
+
+    def group_by(self, *fields):
+        return self.all().group_by(*fields)
+
+    def distinct(self, field):
+        return self.all().distinct(field)
+
     def get(self, **kw):
+        if list(kw) == ['objectId']:
+            # lookups by objectId go through the active ObjectLoader, if any
+            from parse_rest.loader import current_loader
+            loader = current_loader(self.model_class)
+            if loader is not None:
+                return loader.load(kw['objectId'])
         return self.filter(**kw).get()
 
 
@@ -68,6 +393,8 @@ class Queryset(object):
         'lt', 'lte', 'gt', 'gte', 'ne', 'in', 'nin', 'exists', 'select', 'dontSelect', 'all', 'regex', 'relatedTo', 'nearSphere'
     ]
 
+    CURSORS = ['objectId', 'createdAt']
+
     @staticmethod
     def convert_to_parse(value):
         from parse_rest.datatypes import ParseType
@@ -85,6 +412,11 @@ class Queryset(object):
         self._manager = manager
         self._where = collections.defaultdict(dict)
         self._select_related = []
+        self._prefetch_related = []
+        self._row_factory = None
+        # fields left out by only() or defer()
+        self._partial = {}
+        self._group_by = ()
         self._options = {}
         self._result_cache = None
 
@@ -93,6 +425,10 @@ class Queryset(object):
         q._where = copy.deepcopy(self._where, memo)
         q._options = copy.deepcopy(self._options, memo)
         q._select_related.extend(self._select_related)
+        q._prefetch_related.extend(self._prefetch_related)
+        q._row_factory = self._row_factory
+        q._partial = dict(self._partial)
+        q._group_by = self._group_by
         return q
 
     def __iter__(self):
@@ -103,10 +439,41 @@ class Queryset(object):
         #count doesn't return real size of result in all cases (eg if query contains skip option)
         return len(self._fetch())
 
+    def __aiter__(self):
+        from parse_rest import aio
+        return aio.iterate(self)
+
     def __getitem__(self, key):
+        """
+        Slicing returns a new Queryset fetching only that slice, indexing
+        fetches only that object. Once the Queryset is fetched, or for
+        negative indexes and steps, the results are sliced locally.
+        """
+        if self._result_cache is not None:
+            return self._result_cache[key]
         if isinstance(key, slice):
-            raise AttributeError("Slice is not supported for now.")
-        return self._fetch()[key]
+            start, stop = key.start or 0, key.stop
+            if key.step not in (None, 1) or start < 0 or (stop is not None and stop < 0):
+                return self._fetch()[key]
+            skip = self._options.get('skip', 0) + start
+            limit = self._options.get('limit')
+            if limit is not None:
+                limit = max(limit - start, 0)
+            if stop is not None:
+                size = max(stop - start, 0)
+                limit = size if limit is None else min(limit, size)
+            q = copy.deepcopy(self)
+            if skip:
+                q._options['skip'] = skip
+            if limit is not None:
+                q._options['limit'] = limit
+            return q
+        if key < 0:
+            return self._fetch()[key]
+        results = self[key:key + 1]._fetch()
+        if not results:
+            raise IndexError('Queryset index out of range')
+        return results[0]
 
     def _fetch(self, count=False):
         if self._result_cache is not None:
@@ -115,32 +482,243 @@ class Queryset(object):
         Return a list of objects matching query, or if count == True return
         only the number of objects matching.
         """
-        options = dict(self._options)  # make a local copy
+        options = self._query_options()
+        if count:
+            # only the count is needed, not the objects
+            options['limit'] = 0
+            options.pop('include', None)
+            return self._manager._count(**options)
+
+        self._result_cache = self._materialize(self._manager._fetch_raw(**options))
+        return self._result_cache
+
+    def _materialize(self, results):
+        if self._row_factory is not None:
+            return [self._row_factory(data) for data in results]
+        objects = self._manager._materialize(results)
+        if self._partial:
+            for obj in objects:
+                obj._defer_fields(**self._partial)
+        if self._prefetch_related:
+            resolve_pointers(objects, self._prefetch_related)
+        return objects
+
+    def _query_options(self):
+        options = self._query_options_without_where()
         if self._where:
             # JSON encode WHERE values
             options['where'] = json.dumps(self._where)
+        return options
+
+    def _query_options_without_where(self):
+        options = dict(self._options)  # make a local copy
         if self._select_related:
             options['include'] = ','.join(self._select_related)
-        if count:
-            return self._manager._count(**options)
+        return options
 
-        self._result_cache = self._manager._fetch(**options)
-        return self._result_cache
+    def template(self, *conditions, **kw):
+        """
+        compile the queryset, filtered with kw, into a QueryTemplate: filter
+        values can be placeholders P('name') given each time it runs
+        """
+        return QueryTemplate(self.filter(*conditions, **kw))
 
-    def filter(self, **kw):
-        q = copy.deepcopy(self)
+    @staticmethod
+    def _and_where(where, condition):
+        """where clause matching both where and condition"""
+        if not condition:
+            return dict(where)
+        if not where:
+            return dict(condition)
+        if set(where) & set(condition):
+            return {'$and': [dict(where), dict(condition)]}
+        merged = dict(where)
+        merged.update(condition)
+        return merged
+
+    def iterator(self, page_size=100, cursor='objectId', prefetch=0):
+        """
+        Iterate over the results, page_size objects per request, without
+        keeping them in the result cache. Pages follow each other on the
+        cursor field (objectId or createdAt) rather than with skip, so
+        deep pages are as fast as the first one. Results are ordered by the
+        cursor, which can't be combined with order_by().
+
+        With prefetch, a background thread fetches up to that many pages
+        ahead while the current one is being processed.
+        """
+        pages = self._iter_pages(page_size, cursor)
+        if prefetch:
+            pages = self._prefetch(pages, int(prefetch))
+        return (obj for page in pages for obj in self._materialize(page))
+
+    @staticmethod
+    def _prefetch(pages, size):
+        """iterate over pages fetched by a background thread, size pages ahead"""
+        buffer = queue.Queue(size)
+        stop = threading.Event()
+        executor = ThreadPoolExecutor(1)
+        try:
+            submit(executor, _feed, pages, buffer, stop)
+            while True:
+                page, error = buffer.get()
+                if page is None:
+                    if error is not None:
+                        raise error
+                    return
+                yield page
+        finally:
+            stop.set()
+            executor.shutdown(wait=False)
+
+    def _iter_pages(self, page_size, cursor='objectId'):
+        if cursor not in self.CURSORS:
+            raise QueryError("Can't page on %s, use one of %s" % (cursor, self.CURSORS))
+        if 'order' in self._options:
+            raise QueryError("Paging on %s can't be combined with order_by()" % cursor)
+        return self._pages(int(page_size), cursor)
+
+    def _pages(self, page_size, cursor):
+        options = dict(self._options)
+        remaining = options.pop('limit', None)
+        options['order'] = cursor if cursor == 'objectId' else 'createdAt,objectId'
+        if self._select_related:
+            options['include'] = ','.join(self._select_related)
+        condition = None
+        while remaining is None or remaining > 0:
+            options['limit'] = page_size if remaining is None else min(page_size, remaining)
+            where = self._and_where(self._where, condition)
+            if where:
+                options['where'] = json.dumps(where)
+            page = self._manager._fetch_raw(**options)
+            if page:
+                yield page
+            if len(page) < options['limit']:
+                return
+            if remaining is not None:
+                remaining -= len(page)
+            # skip only applies before the first page
+            options.pop('skip', None)
+            last = page[-1]
+            if cursor == 'objectId':
+                condition = {'objectId': {'$gt': last['objectId']}}
+            else:
+                created_at = {'__type': 'Date', 'iso': last['createdAt']}
+                condition = {'$or': [
+                    {'createdAt': {'$gt': created_at}},
+                    {'createdAt': created_at, 'objectId': {'$gt': last['objectId']}}]}
+
+    def parallel_scan(self, partitions=4, key='objectId', workers=None,
+                      ordered=False, page_size=100):
+        """
+        Iterate over the results by splitting them in `partitions` disjoint
+        ranges of key (objectId or createdAt), paged through at the same
+        time by `workers` threads. Objects of different ranges are
+        interleaved as they come, unless ordered is True: the results are
+        then in key order. Filters, keys() and select_related() apply to
+        every range; order_by(), limit() and skip() can't be used.
+        """
+        if key not in self.CURSORS:
+            raise QueryError("Can't partition on %s, use one of %s" % (key, self.CURSORS))
+        for option in ('order', 'limit', 'skip'):
+            if option in self._options:
+                raise QueryError("A parallel scan can't be combined with %s" % option)
+        return self._parallel_scan(int(partitions), key, workers, ordered, int(page_size))
+
+    def _partitions(self, count, key):
+        """split the queryset in at most count querysets over ranges of key"""
+        if key == 'objectId':
+            count = min(count, len(OBJECT_ID_ALPHABET))
+            alphabet = OBJECT_ID_ALPHABET
+            bounds = [alphabet[len(alphabet) * i // count] for i in range(1, count)]
+        else:
+            from parse_rest.datatypes import Date
+            options = dict(self._query_options(), limit=1, keys='objectId')
+            options.pop('include', None)
+            extremes = [self._manager._fetch_raw(order=order, **options)
+                        for order in ('createdAt', '-createdAt')]
+            if not extremes[0]:
+                return []
+            first, last = [Date._from_str(r[0]['createdAt']) for r in extremes]
+            bounds = []
+            for i in range(1, count):
+                bound = Date(first + (last - first) * i // count)._to_native()
+                if bound not in bounds:
+                    bounds.append(bound)
+
+        querysets = []
+        for lower, upper in zip([None] + bounds, bounds + [None]):
+            condition = {}
+            if lower is not None:
+                condition['$gte'] = lower
+            if upper is not None:
+                condition['$lt'] = upper
+            q = copy.deepcopy(self)
+            if condition:
+                q._where = collections.defaultdict(
+                    dict, self._and_where(self._where, {key: condition}))
+            querysets.append(q)
+        return querysets
+
+    def _parallel_scan(self, partitions, key, workers, ordered, page_size):
+        querysets = self._partitions(partitions, key)
+        if not querysets:
+            return
+        workers = min(workers or len(querysets), len(querysets))
+        stop = threading.Event()
+        if ordered:
+            # ranges are consumed in order, each from its own buffer
+            buffers = [queue.Queue(2) for q in querysets]
+            expected = [(buffer, 1) for buffer in buffers]
+        else:
+            buffers = [queue.Queue(2 * workers)] * len(querysets)
+            expected = [(buffers[0], len(querysets))]
+        executor = ThreadPoolExecutor(workers)
+        try:
+            for q, buffer in zip(querysets, buffers):
+                submit(executor, _feed, q._iter_pages(page_size, key), buffer, stop)
+            for buffer, remaining in expected:
+                while remaining:
+                    page, error = buffer.get()
+                    if page is None:
+                        if error is not None:
+                            raise error
+                        remaining -= 1
+                        continue
+                    for obj in self._materialize(page):
+                        yield obj
+        finally:
+            # let the workers give up if the results weren't all consumed
+            stop.set()
+            executor.shutdown(wait=False)
+
+    @staticmethod
+    def _compile_filters(kw, where):
+        """add the conditions of filter keywords to a where clause"""
         for name, value in kw.items():
             parse_value = Queryset.convert_to_parse(value)
             attr, operator = Queryset.extract_filter_operator(name)
             attr = attr.replace("__", ".")
             if operator is None:
-                q._where[attr] = parse_value
+                where[attr] = parse_value
             elif operator == 'relatedTo':
-                q._where['$' + operator] = {'object': parse_value, 'key': attr}
+                where['$' + operator] = {'object': parse_value, 'key': attr}
             else:
-                if not isinstance(q._where[attr], dict):
-                    q._where[attr] = {}
-                q._where[attr]['$' + operator] = parse_value
+                if not isinstance(where[attr], dict):
+                    where[attr] = {}
+                where[attr]['$' + operator] = parse_value
+        return where
+
+    def filter(self, *conditions, **kw):
+        """
+        narrow the queryset with keyword filters, and Q objects combining
+        filters with |, & and ~
+        """
+        q = copy.deepcopy(self)
+        self._compile_filters(kw, q._where)
+        for condition in conditions:
+            q._where = collections.defaultdict(
+                dict, self._and_where(q._where, condition._compile()))
         return q
 
     def limit(self, value):
@@ -158,6 +736,89 @@ class Queryset(object):
         q._options['keys'] = ','.join(fields)
         return q
 
+    def aggregate(self, pipeline):
+        """QueryManager.aggregate on the objects matching the queryset filters"""
+        if self._where:
+            pipeline = [{'$match': dict(self._where)}] + list(pipeline)
+        return self._manager.aggregate(pipeline)
+
+    def distinct(self, field):
+        """
+        the distinct values of field among the objects matching the queryset,
+        computed by the server (this needs the master key)
+        """
+        options = {'distinct': field}
+        if self._where:
+            options['where'] = json.dumps(self._where)
+        return [self._decode({field: value}, field)
+                for value in self._manager._aggregate(**options)]
+
+    def group_by(self, *fields):
+        """group the objects by fields before computing values with annotate()"""
+        q = copy.deepcopy(self)
+        q._group_by = fields
+        return q
+
+    def annotate(self, **aggregates):
+        """
+        compute values like Sum('score') or Count() over each group of
+        group_by() (or over all the objects) on the server, returning a
+        dict per group with the grouped fields and the computed values.
+        order_by(), limit() and skip() apply to the groups.
+        """
+        fields = self._group_by
+        if len(fields) == 1:
+            group_id, sort_keys = '$' + fields[0], {fields[0]: '_id'}
+        else:
+            group_id = dict((f, '$' + f) for f in fields) or None
+            sort_keys = dict((f, '_id.' + f) for f in fields)
+        group = {'_id': group_id}
+        for name, aggregate in aggregates.items():
+            group[name] = aggregate._to_native()
+        pipeline = [{'$group': group}]
+        if 'order' in self._options:
+            sort = collections.OrderedDict()
+            for key in self._options['order'].split(','):
+                name = key.lstrip('-')
+                sort[sort_keys.get(name, name)] = -1 if key.startswith('-') else 1
+            pipeline.append({'$sort': sort})
+        if 'skip' in self._options:
+            pipeline.append({'$skip': self._options['skip']})
+        if 'limit' in self._options:
+            pipeline.append({'$limit': self._options['limit']})
+
+        rows = []
+        for result in self.aggregate(pipeline):
+            # parse-server returns the group _id as objectId
+            group_id = result.pop('objectId', result.pop('_id', None))
+            row = {}
+            if len(fields) == 1:
+                row[fields[0]] = group_id
+            elif fields:
+                row.update((f, (group_id or {}).get(f)) for f in fields)
+            row.update(result)
+            rows.append(dict((k, self._decode(row, k)) for k in row))
+        return rows
+
+    def only(self, *fields):
+        """
+        fetch only these fields: other fields are fetched one at a time (or
+        by DEFERRED_GROUPS of the class) when they are read
+        """
+        q = self.keys(*fields)
+        q._partial = {'fetched': fields}
+        return q
+
+    def defer(self, *fields):
+        """
+        don't fetch these fields: they are fetched one at a time (or by
+        DEFERRED_GROUPS of the class) when they are read
+        """
+        q = copy.deepcopy(self)
+        q._options['excludeKeys'] = ','.join(fields)
+        q._partial = {'deferred': fields}
+        return q
+
     def order_by(self, order, descending=False):
         q = copy.deepcopy(self)
         # add a minus sign before the order value if descending == True
@@ -169,14 +830,126 @@ class Queryset(object):
         q._select_related.extend(fields)
         return q
 
+    @staticmethod
+    def _decode(data, field):
+        """a field of a result, decoded like object attributes are"""
+        from parse_rest.datatypes import Date, ParseType
+        value = data.get(field)
+        if field in ('createdAt', 'updatedAt') and isinstance(value, six.string_types):
+            return Date._from_str(value)
+        return ParseType.convert_from_parse(field, value)
+
+    def _rows(self, fields, factory):
+        q = self.keys(*fields) if fields else copy.deepcopy(self)
+        q._row_factory = factory
+        return q
+
+    def values(self, *fields):
+        """
+        fetch only the given fields (or all of them) as dicts instead of
+        objects, see also values_list and rows
+        """
+        decode = self._decode
+        if fields:
+            return self._rows(fields, lambda data: dict((f, decode(data, f)) for f in fields))
+        return self._rows(fields, lambda data: dict((f, decode(data, f)) for f in data))
+
+    def values_list(self, *fields, **kw):
+        """
+        fetch only the given fields as tuples, or with flat=True the values
+        of a single field
+        """
+        flat = kw.pop('flat', False)
+        if kw:
+            raise TypeError('Unexpected arguments %s' % ', '.join(kw))
+        if not fields:
+            raise QueryError('values_list() needs the fields to fetch')
+        decode = self._decode
+        if flat:
+            if len(fields) != 1:
+                raise QueryError('values_list(flat=True) takes a single field')
+            field = fields[0]
+            return self._rows(fields, lambda data: decode(data, field))
+        return self._rows(fields, lambda data: tuple(decode(data, f) for f in fields))
+
+    def rows(self, *fields):
+        """fetch only the given fields as named tuples"""
+        if not fields:
+            raise QueryError('rows() needs the fields to fetch')
+        decode = self._decode
+        row = collections.namedtuple(self._manager.model_class.__name__ + 'Row',
+                                     fields, rename=True)
+        return self._rows(fields, lambda data: row._make(decode(data, f) for f in fields))
+
+    def prefetch_related(self, *fields):
+        """
+        load the objects pointed to by fields with a few batched queries
+        once the results are fetched, see resolve_pointers
+        """
+        q = copy.deepcopy(self)
+        q._prefetch_related.extend(fields)
+        return q
+
     def count(self):
         return self._fetch(count=True)
 
     def exists(self):
-        return bool(self)
+        if self._result_cache is not None:
+            return bool(self._result_cache)
+        options = self[:1]._query_options()
+        if options.get('limit') == 0:
+            return False
+        options['keys'] = 'objectId'
+        options.pop('include', None)
+        return bool(self._manager._fetch_raw(**options))
 
     def get(self):
-        results = self._fetch()
+        if self._result_cache is not None:
+            return self._get_single(self._result_cache)
+        # two results are enough to know there are several
+        return self._get_single(self[:2]._fetch())
+
+    def first(self):
+        """the first object, or None if there are none"""
+        results = self._result_cache if self._result_cache is not None else self[:1]._fetch()
+        return results[0] if results else None
+
+    def last(self):
+        """
+        the last object in the queryset order (by creation if unordered),
+        or None if there are none
+        """
+        if self._result_cache is not None or 'skip' in self._options or 'limit' in self._options:
+            results = self._fetch()
+            return results[-1] if results else None
+        order = self._options.get('order', 'createdAt')
+        q = copy.deepcopy(self)
+        q._options['order'] = ','.join(key[1:] if key.startswith('-') else '-' + key
+                                       for key in order.split(','))
+        return q.first()
+
+    def earliest(self, field='createdAt'):
+        """the object with the lowest value of field"""
+        return self._get_single(self.order_by(field)[:1]._fetch())
+
+    def latest(self, field='createdAt'):
+        """the object with the highest value of field"""
+        return self._get_single(self.order_by(field, descending=True)[:1]._fetch())
+
+    def afetch(self):
+        """awaitable version of fetching the queryset, see parse_rest.aio"""
+        from parse_rest import aio
+        return aio.fetch(self)
+
+    def acount(self):
+        from parse_rest import aio
+        return aio.count(self)
+
+    def aget(self):
+        from parse_rest import aio
+        return aio.get(self)
+
+    def _get_single(self, results):
         if len(results) == 0:
             error_message = 'Query against %s returned no results' % (
                     self._manager.model_class.ENDPOINT_ROOT)
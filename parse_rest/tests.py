@@ -7,19 +7,29 @@ Contains unit tests for the Python Parse REST API wrapper
 from __future__ import print_function
 
 import os
+import socket
 import sys
 import subprocess
+import threading
+import time
 import unittest
 import datetime
 import six
+from six.moves import socketserver
 from itertools import chain
 
-from parse_rest.core import ResourceRequestNotFound
+from parse_rest.core import ResourceRequestNotFound, ParseError, ParseBatchError
+from parse_rest import connection
 from parse_rest.connection import register, ParseBatcher, SessionToken, MasterKey
 from parse_rest.datatypes import GeoPoint, Object, Function, Pointer
 from parse_rest.user import User
 from parse_rest import query
+from parse_rest.query import P, Q
 from parse_rest.installation import Push
+from parse_rest.unitofwork import UnitOfWork, IdentityMap
+from parse_rest.counters import CounterAggregator
+from parse_rest.cache import QueryCache
+from parse_rest.loader import ObjectLoader
 
 try:
     import settings_local
@@ -130,6 +140,24 @@ class TestObject(unittest.TestCase):
         city = City.Query.get(name='São Paulo')
         self.assertEqual(city.country, 'Brazil', 'Could not update object')
 
+    def testUpdateSendsOnlyChanges(self):
+        self.score.save()
+        updated_at = self.score.updatedAt
+        self.score.save()
+        self.assertEqual(self.score.updatedAt, updated_at, 'Unchanged object was saved')
+
+        score = GameScore.Query.get(objectId=self.score.objectId)
+        self.assertEqual(score._changed_native(), {})
+        score.achievements.append('Hero')
+        del score.cheat_mode
+        self.assertEqual(sorted(score._changed_native()), ['achievements', 'cheat_mode'])
+        score.save()
+        self.assertEqual(score._changed_native(), {})
+
+        score = GameScore.Query.get(objectId=self.score.objectId)
+        self.assertEqual(score.achievements, ['No Miss', 'Ninja', 'Hero'])
+        self.assertFalse(hasattr(score, 'cheat_mode'))
+
     def testCanDeleteExistingObject(self):
         self.score.save()
         object_id = self.score.objectId
@@ -144,6 +172,31 @@ class TestObject(unittest.TestCase):
         self.assertTrue(GameScore.Query.filter(score=previous_score + 1).exists(),
                      'Failed to increment score on backend')
                      
+    def testDeferredOperations(self):
+        self.score.save()
+        self.score.increment('score', defer=True)
+        self.score.increment('score', 2, defer=True)
+        self.score.addUniqueToArray('achievements', ['Hero'], defer=True)
+        self.score.addUniqueToArray('achievements', ['Ninja', 'Boss'], defer=True)
+        self.score.player_name = 'Jane'
+        self.assertEqual(self.score.score, 1340)
+        self.assertFalse(GameScore.Query.filter(score=1340).exists())
+
+        self.score.save()
+        score = GameScore.Query.get(objectId=self.score.objectId)
+        self.assertEqual(score.score, 1340)
+        self.assertEqual(score.achievements, ['No Miss', 'Ninja', 'Hero', 'Boss'])
+        self.assertEqual(score.player_name, 'Jane')
+        self.assertEqual(self.score._changed_native(), {})
+
+        with UnitOfWork():
+            self.score.increment('score')
+            self.score.increment('score')
+        self.assertEqual(GameScore.Query.get(objectId=self.score.objectId).score, 1342)
+
+        self.score.increment('score', defer=True)
+        self.assertRaises(ParseError, self.score.remove, 'score', defer=True)
+
     def testCanRemoveField(self):
         self.score.save()
         self.score.remove('score')
@@ -204,6 +257,166 @@ class TestObject(unittest.TestCase):
         self.assertEqual(GameScore.Query.filter(player_name='Jane').count(), 0,
                      "batch_delete didn't delete objects")
 
+    def testBatchIsChunked(self):
+        """test batches larger than what the server accepts in one request"""
+        scores = [GameScore(score=s, player_name='Chunky') for s in range(120)]
+        batcher = ParseBatcher(max_workers=2)
+        self.assertEqual([len(c) for c in batcher._chunks([s.save(batch=True)[0] for s in scores])],
+                         [50, 50, 20])
+
+        batcher.batch_save(scores)
+        self.assertTrue(all(s.objectId is not None for s in scores),
+                        "batch_save didn't record object IDs")
+        self.assertEqual(GameScore.Query.filter(player_name='Chunky').count(), 120)
+
+        batcher.batch_delete(scores)
+        self.assertEqual(GameScore.Query.filter(player_name='Chunky').count(), 0)
+
+
+    def testBatchErrorsAreKeptWithAFailedChunk(self):
+        class FailingBatcher(ParseBatcher):
+            def _execute_chunk(self, client, queries):
+                if queries[0]['method'] == 'POST':
+                    raise ParseError('chunk lost')
+                return ParseBatcher._execute_chunk(self, client, queries)
+
+        missing = GameScore(objectId='missing', score=8)
+        with self.assertRaises(ParseError) as raised:
+            FailingBatcher(max_requests=1).batch_save([missing, GameScore(score=9)])
+        self.assertEqual(str(raised.exception), 'chunk lost')
+        self.assertEqual([e['code'] for e in raised.exception.batch_errors], [101])
+
+    def testUnitOfWork(self):
+        """test saves and deletes are queued until the unit of work ends"""
+        scores = [GameScore(score=s, player_name='Unit') for s in range(3)]
+        with UnitOfWork() as unit_of_work:
+            for s in scores:
+                s.save()
+            scores[0].score = 10
+            scores[0].save()
+            self.assertEqual(len(unit_of_work), 3)
+            self.assertIsNone(scores[0].objectId)
+        self.assertTrue(all(s.objectId is not None for s in scores))
+        self.assertEqual(sorted(s.score for s in GameScore.Query.filter(player_name='Unit')),
+                         [1, 2, 10])
+
+        with UnitOfWork():
+            for s in scores:
+                s.delete()
+            self.assertEqual(GameScore.Query.filter(player_name='Unit').count(), 3)
+        self.assertEqual(GameScore.Query.filter(player_name='Unit').count(), 0)
+
+    def testUnitOfWorkCreatesPointedObjectsFirst(self):
+        game = Game(title='Unit')
+        score = GameScore(score=5, player_name='Unit', game=game)
+        with UnitOfWork():
+            score.save()
+            game.save()
+        self.assertEqual(GameScore.Query.get(objectId=score.objectId).game.objectId,
+                         game.objectId)
+        ParseBatcher().batch_delete([score, game])
+
+        first, second = GameScore(player_name='Unit'), GameScore(player_name='Unit')
+        first.next, second.next = second, first
+        unit_of_work = UnitOfWork()
+        with self.assertRaises(ParseError):
+            with unit_of_work:
+                first.save()
+                second.save()
+        self.assertEqual(len(unit_of_work), 2)
+
+    def testUnitOfWorkSendsWhatItCanBeforeRaising(self):
+        game = Game(title='Unit')
+        score = GameScore(score=7, player_name='Unit', game=game)
+        missing = GameScore(objectId='missing', score=8)
+        unit_of_work = UnitOfWork()
+        with self.assertRaises(ParseBatchError):
+            with unit_of_work:
+                score.save()
+                game.save()
+                missing.save()
+        self.assertIsNotNone(score.objectId)
+        self.assertEqual(len(unit_of_work), 0)
+
+        # an error of the timer is raised after the queue is sent
+        later = GameScore(score=9, player_name='Unit')
+        with self.assertRaises(ParseBatchError):
+            with UnitOfWork(max_delay=0.01):
+                missing.save()
+                time.sleep(0.1)
+                later.save()
+        self.assertIsNotNone(later.objectId)
+        ParseBatcher().batch_delete([score, game, later])
+
+    def testUnitOfWorkMaxDelay(self):
+        score = GameScore(score=6, player_name='Unit')
+        with UnitOfWork(max_delay=0.05) as unit_of_work:
+            score.save()
+            for _ in range(100):
+                if score.objectId:
+                    break
+                time.sleep(0.01)
+            self.assertIsNotNone(score.objectId, 'max_delay did not flush the queue')
+            self.assertEqual(len(unit_of_work), 0)
+        score.delete()
+
+    def testCounterAggregator(self):
+        self.score.save()
+        with CounterAggregator(flush_interval=None, threshold=3) as counters:
+            for _ in range(5):
+                counters.increment(self.score, 'score')
+            counters.add('GameScore', self.score.objectId, 'score', 10)
+            counters.add('GameScore', self.score.objectId, 'likes', 2)
+            self.assertEqual(len(counters), 2)
+            self.assertEqual(GameScore.Query.get(objectId=self.score.objectId).score, 1337)
+            counters.add('GameScore', self.score.objectId, 'views')
+        self.assertEqual(len(counters), 0)
+        score = GameScore.Query.get(objectId=self.score.objectId)
+        self.assertEqual((score.score, score.likes, score.views), (1352, 2, 1))
+
+
+    def testCounterAggregatorKeepsFlushingAfterAnError(self):
+        self.score.save()
+
+        class FlakyBatcher(ParseBatcher):
+            failures = 1
+
+            def batch(self, methods):
+                if self.failures:
+                    self.failures -= 1
+                    raise ParseError('flaky')
+                return ParseBatcher.batch(self, methods)
+
+        counters = CounterAggregator(flush_interval=0.02, batcher=FlakyBatcher())
+        with self.assertLogs('parse_rest.counters'):
+            counters.add('GameScore', self.score.objectId, 'score', 3)
+            for _ in range(100):
+                if not len(counters) and not counters.batcher.failures:
+                    break
+                time.sleep(0.02)
+        counters.close()
+        self.assertEqual(GameScore.Query.get(objectId=self.score.objectId).score, 1340)
+        self.score.delete()
+
+    def testCounterAggregatorDropsRefusedDeltas(self):
+        self.score.save()
+        counters = CounterAggregator(flush_interval=None)
+        counters.add('GameScore', 'missing', 'score')
+        counters.add('GameScore', self.score.objectId, 'score')
+        with self.assertLogs('parse_rest.counters'):
+            counters.flush()
+        self.assertEqual(len(counters), 0)
+        counters.close()
+        self.assertEqual(GameScore.Query.get(objectId=self.score.objectId).score, 1338)
+        self.score.delete()
+
+    def testCounterAggregatorCanBeCollected(self):
+        import gc
+        import weakref
+        counters = weakref.ref(CounterAggregator(flush_interval=None))
+        gc.collect()
+        self.assertIsNone(counters())
+
 
 class TestPointer(unittest.TestCase):
 
@@ -289,6 +502,62 @@ class TestQuery(unittest.TestCase):
         self.assertFalse(GameScore.Query.filter(score=10).exists(),
                          "exists giving false positive")
 
+    def testMinimalFetches(self):
+        q = GameScore.Query.all().order_by('score')
+        self.assertEqual(q.first().score, 1)
+        self.assertEqual(q.last().score, 5)
+        self.assertEqual(q.order_by('score', descending=True).last().score, 1)
+        self.assertEqual(q.earliest('score').score, 1)
+        self.assertEqual(q.latest('score').score, 5)
+        self.assertEqual(GameScore.Query.all().latest().objectId,
+                         GameScore.Query.all().last().objectId)
+        self.assertIsNone(GameScore.Query.filter(score=10).first())
+        self.assertIsNone(GameScore.Query.filter(score=10).last())
+        self.assertRaises(query.QueryResourceDoesNotExist,
+                          GameScore.Query.filter(score=10).latest)
+        self.assertFalse(q.limit(0).exists())
+        self.assertEqual(q.count(), 5)
+        self.assertIsNone(q._result_cache)
+
+    def testQueryCache(self):
+        cache = QueryCache(max_size=2, ttl=60)
+        connection.DEFAULT_CLIENT.query_cache = cache
+        try:
+            self.assertEqual(GameScore.Query.filter(score__gt=3).count(), 2)
+            scores = list(GameScore.Query.filter(score__gt=3))
+            scores[0].player_name = 'Changed locally'
+            self.assertEqual(GameScore.Query.filter(score__gt=3).count(), 2)
+            self.assertEqual([s.player_name for s in GameScore.Query.filter(score__gt=3)],
+                             ['John Doe', 'John Doe'])
+            self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+            # writes to the class invalidate its queries
+            extra = GameScore(score=10, player_name='Jane')
+            extra.save()
+            self.test_objects.append(extra)
+            self.assertEqual(GameScore.Query.filter(score__gt=3).count(), 3)
+            ParseBatcher().batch_delete([extra])
+            self.test_objects = []
+            self.assertEqual(GameScore.Query.filter(score__gt=3).count(), 2)
+
+            GameScore.Query.filter(score=1).count()
+            GameScore.Query.filter(score=2).count()
+            self.assertEqual(len(cache), 2)
+            self.assertEqual(cache.stats()['evictions'], 1)
+        finally:
+            connection.DEFAULT_CLIENT.query_cache = None
+
+    def testQueryCacheDropsResponsesOlderThanAWrite(self):
+        cache = QueryCache()
+
+        def send_during_write():
+            cache.invalidate(GameScore.ENDPOINT_ROOT + '/abc')
+            return {'results': []}
+        cache.fetch(GameScore, {'limit': 1}, send_during_write)
+        self.assertEqual(len(cache), 0)
+        cache.fetch(GameScore, {'limit': 1}, lambda: {'results': []})
+        self.assertEqual(len(cache), 1)
+
     def testCanFilter(self):
         '''test the Queryset.filter() method'''
         for s in self.scores:
@@ -376,6 +645,243 @@ class TestQuery(unittest.TestCase):
         q = GameScore.Query.all().skip(3)
         self.assertEqual(len(q), 2)
 
+    def testIterator(self):
+        for cursor in ('objectId', 'createdAt'):
+            q = GameScore.Query.filter(score__gt=1)
+            self.assertEqual(sorted(s.score for s in q.iterator(page_size=2, cursor=cursor)),
+                             [2, 3, 4, 5])
+            self.assertIsNone(q._result_cache)
+            ids = [s.objectId for s in q.limit(3).iterator(page_size=2, cursor=cursor)]
+            self.assertEqual(len(set(ids)), 3)
+        self.assertRaises(query.QueryError, GameScore.Query.all().order_by('score').iterator)
+
+    def testIteratorPrefetch(self):
+        scores = GameScore.Query.all().iterator(page_size=2, prefetch=2)
+        self.assertEqual(sorted(s.score for s in scores), [1, 2, 3, 4, 5])
+        scores = GameScore.Query.all().iterator(page_size=1, prefetch=1)
+        self.assertIsInstance(next(scores), GameScore)
+        scores.close()
+
+    def testParallelScan(self):
+        for key in ('objectId', 'createdAt'):
+            scores = GameScore.Query.filter(score__lt=5).parallel_scan(
+                partitions=3, key=key, page_size=1)
+            self.assertEqual(sorted(s.score for s in scores), [1, 2, 3, 4])
+            scores = list(GameScore.Query.all().parallel_scan(
+                partitions=3, key=key, ordered=True))
+            keys = [getattr(s, key) for s in scores]
+            self.assertEqual(keys, sorted(keys))
+            self.assertEqual(len(scores), 5)
+        self.assertRaises(query.QueryError, GameScore.Query.all().limit(2).parallel_scan)
+
+    def testSlicing(self):
+        q = GameScore.Query.all().order_by('score')
+        self.assertEqual([s.score for s in q[1:3]], [2, 3])
+        self.assertEqual([s.score for s in q[3:]], [4, 5])
+        self.assertEqual([s.score for s in q.skip(1)[1:10][:2]], [3, 4])
+        self.assertEqual(q[1:3]._options, {'order': 'score', 'skip': 1, 'limit': 2})
+        self.assertIsNone(q._result_cache)
+        self.assertEqual(q[2].score, 3)
+        self.assertEqual(q[-1].score, 5)
+        self.assertRaises(IndexError, lambda: q[10])
+        # once fetched, slices are local
+        self.assertEqual([s.score for s in q[0:2]], [1, 2])
+        self.assertEqual([s.score for s in q[::2]], [1, 3, 5])
+
+    def testPrefetchRelated(self):
+        scores = list(GameScore.Query.all().prefetch_related('game'))
+        self.assertEqual(len(scores), 5)
+        for score in scores:
+            self.assertTrue(score.game.__dict__.get('_is_loaded', True))
+            self.assertEqual(score.game.__dict__.get('title'), 'Candyland')
+
+        creator = CollectedItem(type='Sword')
+        creator.save()
+        self.test_objects.append(creator)
+        self.game.creator = creator
+        self.game.save()
+        try:
+            scores = list(GameScore.Query.all())
+            self.assertFalse(scores[0].game.__dict__.get('_is_loaded', True))
+            query.resolve_pointers(scores, ['game.creator'], chunk_size=1)
+            for score in scores:
+                self.assertEqual(score.game.__dict__['creator'].__dict__.get('type'), 'Sword')
+        finally:
+            self.game.creator = None
+            self.game.save()
+
+    def testIdentityMap(self):
+        with IdentityMap() as identity_map:
+            scores = list(GameScore.Query.all().order_by('score'))
+            self.assertTrue(all(s.game is scores[0].game for s in scores))
+            self.assertIs(GameScore.Query.get(score=1), scores[0])
+            self.assertEqual(len(identity_map), 6)
+
+            # unchanged data doesn't overwrite local changes
+            scores[1].player_name = 'Local'
+            GameScore.Query.get(score=2)
+            self.assertEqual(scores[1].player_name, 'Local')
+
+            # more recent data is merged
+            copy = GameScore.Query.filter(score=3).keys('score').limit(1)
+            with IdentityMap():
+                changed = copy[0]
+                self.assertIsNot(changed, scores[2])
+                changed.player_name = 'Jane'
+                changed.save()
+            self.assertIs(GameScore.Query.get(score=3), scores[2])
+            self.assertEqual(scores[2].player_name, 'Jane')
+        self.assertIsNot(GameScore.Query.get(score=1), scores[0])
+        scores[2].player_name = 'John Doe'
+        scores[2].save()
+
+    def testObjectLoader(self):
+        from concurrent.futures import ThreadPoolExecutor
+        ids = [s.objectId for s in self.scores]
+        with ObjectLoader(GameScore, window=0.2) as loader:
+            batches = count_loader_batches(loader)
+            with ThreadPoolExecutor(5) as executor:
+                futures = [connection.submit(executor, GameScore.Query.get, objectId=i)
+                           for i in ids]
+            self.assertEqual([f.result().objectId for f in futures], ids)
+            self.assertEqual(len(batches), 1)
+            self.assertIs(GameScore.Query.get(objectId=ids[0]), futures[0].result())
+            self.assertEqual([s.objectId for s in loader.load_many(ids)], ids)
+            self.assertEqual(len(batches), 1)
+            self.assertRaises(query.QueryResourceDoesNotExist, loader.load, 'missing')
+        self.assertIsNot(GameScore.Query.get(objectId=ids[0]), futures[0].result())
+
+    def testTemplate(self):
+        template = GameScore.Query.template(score__gte=P('low'), score__lte=P('high'))
+        self.assertEqual(sorted(s.score for s in template.fetch(low=2, high=4)), [2, 3, 4])
+        self.assertEqual(template.count(low=4, high=10), 2)
+        self.assertEqual(template.get(low=5, high=5).score, 5)
+        self.assertIsNone(template.first(low=6, high=10))
+        self.assertRaises(query.QueryError, template.fetch, low=1)
+
+        template = GameScore.Query.filter(game=P('game')).order_by('-score').template()
+        self.assertEqual(template.first(game=self.game).score, 5)
+
+    def testQObjects(self):
+        scores = GameScore.Query.filter(Q(score=1) | Q(score__gte=4)).order_by('score')
+        self.assertEqual([s.score for s in scores], [1, 4, 5])
+        scores = GameScore.Query.filter(Q(score=1) | Q(score=2) | Q(score=5), score__gt=1)
+        self.assertEqual(sorted(s.score for s in scores), [2, 5])
+        scores = GameScore.Query.filter(~Q(score__in=[2, 3]) & (Q(score=1) | Q(score=4)))
+        self.assertEqual(sorted(s.score for s in scores), [1, 4])
+        scores = GameScore.Query.filter(Q(score=1) | Q(score=2)).filter(Q(score=2) | Q(score=3))
+        self.assertEqual([s.score for s in scores], [2])
+        self.assertEqual(GameScore.Query.filter(Q(score=1) | Q(score=3)).count(), 2)
+        first = GameScore.Query.filter(Q(score=3) | Q(score=5)).select_related('game') \
+            .order_by('score', descending=True).limit(1)[0]
+        self.assertEqual((first.score, first.game.__dict__.get('title')), (5, 'Candyland'))
+
+    def testValues(self):
+        q = GameScore.Query.filter(score__lte=2).order_by('score')
+        self.assertEqual(q.values('score', 'player_name')[0], {'score': 1, 'player_name': 'John Doe'})
+        self.assertEqual(list(q.values_list('score', flat=True)), [1, 2])
+        self.assertEqual(list(q.values_list('score', 'player_name')),
+                         [(1, 'John Doe'), (2, 'John Doe')])
+        row = q.rows('score', 'game', 'createdAt').first()
+        self.assertEqual(row.score, 1)
+        self.assertIsInstance(row.game, Game)
+        self.assertIsInstance(row.createdAt, datetime.datetime)
+        values = GameScore.Query.filter(score=5).values().get()
+        self.assertEqual(values['player_name'], 'John Doe')
+        self.assertRaises(query.QueryError, q.values_list, 'score', 'game', flat=True)
+
+    def testDeferredFields(self):
+        score = GameScore.Query.filter(score=1).defer('player_name').get()
+        self.assertNotIn('player_name', score.__dict__)
+        self.assertEqual(score.player_name, 'John Doe')
+        self.assertEqual(score._changed_native(), {})
+
+        score = GameScore.Query.filter(score=1).only('score').get()
+        self.assertEqual(sorted(k for k in score.__dict__ if not k.startswith('_')),
+                         ['objectId', 'score'])
+        self.assertIsInstance(score.game, Game)
+        self.assertNotIn('player_name', score.__dict__)
+        self.assertFalse(hasattr(score, 'missing_field'))
+
+        GameScore.DEFERRED_GROUPS = [('player_name', 'game')]
+        try:
+            score = GameScore.Query.filter(score=1).only('score').get()
+            self.assertEqual(score.player_name, 'John Doe')
+            self.assertIn('game', score.__dict__)
+        finally:
+            del GameScore.DEFERRED_GROUPS
+
+    def testRefreshAllSkipsQueryCache(self):
+        score = GameScore.Query.filter(score=1).get()
+        outside = connection.Client(
+            getattr(settings_local, 'APPLICATION_ID'),
+            getattr(settings_local, 'REST_API_KEY'),
+            master_key=getattr(settings_local, 'MASTER_KEY'))
+        connection.DEFAULT_CLIENT.query_cache = QueryCache()
+        try:
+            GameScore.refresh_all([score])
+            with outside:
+                other = GameScore.Query.filter(score=1).get()
+                other.player_name = 'Outside'
+                other.save()
+            GameScore.refresh_all([score])
+            self.assertEqual(score.player_name, 'Outside')
+        finally:
+            connection.DEFAULT_CLIENT.query_cache = None
+            outside.pool.clear()
+            score.player_name = 'John Doe'
+            score.save()
+
+    def testRefresh(self):
+        scores = list(GameScore.Query.all().order_by('score'))
+        others = list(GameScore.Query.all().order_by('score'))
+        for other in others:
+            other.player_name = 'Refreshed'
+        ParseBatcher().batch_save(others)
+        try:
+            scores[0].player_name = 'Local'
+            scores[0].extra = 'Local'
+            chunk_size, query.RESOLVE_CHUNK_SIZE = query.RESOLVE_CHUNK_SIZE, 2
+            try:
+                GameScore.refresh_all(scores, keys=['player_name'])
+            finally:
+                query.RESOLVE_CHUNK_SIZE = chunk_size
+            self.assertEqual([s.player_name for s in scores], ['Refreshed'] * 5)
+            self.assertEqual(list(scores[0]._changed_native()), ['extra'])
+
+            scores[0].refresh()
+            self.assertFalse(hasattr(scores[0], 'extra'))
+            self.assertEqual(scores[0]._changed_native(), {})
+        finally:
+            for other in others:
+                other.player_name = 'John Doe'
+            ParseBatcher().batch_save(others)
+
+    def testAggregate(self):
+        extra = GameScore(score=10, player_name='Jane Doe')
+        extra.save()
+        self.test_objects.append(extra)
+        with MasterKey(getattr(settings_local, 'MASTER_KEY')):
+            totals = GameScore.Query.all().group_by('player_name').order_by('-total') \
+                .annotate(total=query.Sum('score'), games=query.Count(), best=query.Max('score'))
+            self.assertEqual(totals, [
+                {'player_name': 'John Doe', 'total': 15, 'games': 5, 'best': 5},
+                {'player_name': 'Jane Doe', 'total': 10, 'games': 1, 'best': 10}])
+            average = GameScore.Query.filter(score__lte=3).annotate(average=query.Avg('score'))
+            self.assertEqual(average, [{'average': 2}])
+            results = GameScore.Query.aggregate([{'$match': {'score': {'$gte': 5}}},
+                                                 {'$group': {'_id': None, 'n': {'$sum': 1}}}])
+            self.assertEqual(results[0]['n'], 2)
+
+    def testDistinct(self):
+        extra = GameScore(score=10, player_name='Jane Doe')
+        extra.save()
+        self.test_objects.append(extra)
+        self.assertEqual(sorted(GameScore.Query.distinct('player_name')), ['Jane Doe', 'John Doe'])
+        self.assertEqual(GameScore.Query.filter(score__lt=10).distinct('player_name'), ['John Doe'])
+        games = GameScore.Query.all().distinct('game')
+        self.assertEqual([g.objectId for g in games], [self.game.objectId])
+
     def testSelectRelated(self):
         score = GameScore.Query.all().select_related('game').limit(1)[0]
         self.assertTrue(score.game.objectId)
@@ -427,6 +933,99 @@ class TestQuery(unittest.TestCase):
         self.assertEqual(len(game_scores_in), len(game_scores_direct))
 
 
+@unittest.skipIf(sys.version_info < (3, 6), 'asyncio support requires python 3.6+')
+class TestAsync(unittest.TestCase):
+    def setUp(self):
+        import asyncio
+        self.loop = asyncio.new_event_loop()
+        self.score = GameScore(score=4242, player_name='Async')
+
+    def tearDown(self):
+        from parse_rest import aio
+        ParseBatcher().batch_delete(GameScore.Query.filter(player_name='Async'))
+        aio.POOL.clear()
+        self.loop.close()
+
+    def run_async(self, awaitable):
+        return self.loop.run_until_complete(awaitable)
+
+    def testCanSaveAndQuery(self):
+        self.run_async(self.score.asave())
+        self.assertIsNotNone(self.score.objectId)
+
+        score = self.run_async(GameScore.Query.filter(player_name='Async').aget())
+        self.assertEqual(score.objectId, self.score.objectId)
+        self.assertEqual(self.run_async(GameScore.Query.filter(player_name='Async').acount()), 1)
+
+        self.run_async(self.score.adelete())
+        self.assertFalse(GameScore.Query.filter(player_name='Async').exists())
+
+    def testCanBatch(self):
+        scores = [GameScore(score=s, player_name='Async') for s in range(5)]
+        self.run_async(ParseBatcher().abatch_save(scores))
+        self.assertTrue(all(s.objectId is not None for s in scores))
+        results = self.run_async(GameScore.Query.filter(player_name='Async').afetch())
+        self.assertEqual(len(results), 5)
+
+    def testQueryCache(self):
+        cache = connection.DEFAULT_CLIENT.query_cache = QueryCache()
+        try:
+            self.run_async(self.score.asave())
+            query = GameScore.Query.filter(player_name='Async')
+            self.assertEqual(self.run_async(query.acount()), 1)
+            self.assertEqual(self.run_async(query.acount()), 1)
+            self.assertEqual(len(self.run_async(query.filter().afetch())), 1)
+            self.assertEqual((cache.hits, cache.misses), (1, 2))
+        finally:
+            connection.DEFAULT_CLIENT.query_cache = None
+
+    def testUserIsSavedWithItsSession(self):
+        from parse_rest import aio
+        user = User.signup('async@example.com', 'secret')
+        sent = []
+        urlopen = aio.POOL.urlopen
+
+        def recording_urlopen(method, url, body=None, headers=None):
+            sent.append((method, headers.get('X-Parse-Session-Token')))
+            return urlopen(method, url, body, headers)
+        aio.POOL.urlopen = recording_urlopen
+        try:
+            user.phone = '555-0100'
+            self.run_async(user.asave())
+            self.run_async(user.adelete())
+        finally:
+            del aio.POOL.urlopen
+        self.assertEqual(sent, [('PUT', user.sessionToken), ('DELETE', user.sessionToken)])
+        self.assertFalse(User.Query.filter(username='async@example.com').exists())
+
+    def testLoaderCoalescesLookups(self):
+        import asyncio
+        scores = [GameScore(score=s, player_name='Async') for s in range(3)]
+        ParseBatcher().batch_save(scores)
+        loader = ObjectLoader(GameScore)
+        batches = count_loader_batches(loader)
+        ids = [s.objectId for s in scores]
+        asyncio.set_event_loop(self.loop)
+        try:
+            loaded = self.run_async(asyncio.gather(*[loader.aload(i) for i in ids + ids]))
+        finally:
+            asyncio.set_event_loop(None)
+        self.assertEqual([s.objectId for s in loaded], ids + ids)
+        self.assertEqual(len(batches), 1)
+
+
+def count_loader_batches(loader):
+    """record the ids of each query sent by an ObjectLoader"""
+    batches = []
+    store = loader._store
+
+    def counting_store(credentials, objects):
+        batches.append([o.objectId for o in objects])
+        store(credentials, objects)
+    loader._store = counting_store
+    return batches
+
+
 class TestFunction(unittest.TestCase):
     def setUp(self):
         '''create and deploy cloud functions'''
@@ -614,6 +1213,48 @@ class TestSessionToken(unittest.TestCase):
             self.assertIn('session_token', self.get_access_keys())
         self.assertNotIn('session_token', self.get_access_keys())
 
+    def testSessionTokenIsContextLocal(self):
+        seen = {}
+
+        def worker(token):
+            with SessionToken(token=token):
+                barrier.wait()
+                seen[token] = self.get_access_keys().get('session_token')
+                barrier.wait()
+
+        barrier = threading.Barrier(2)
+        threads = [threading.Thread(target=worker, args=(t,)) for t in ('a', 'b')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(seen, {'a': 'a', 'b': 'b'})
+        self.assertNotIn('session_token', self.get_access_keys())
+
+    def testSharedInstanceIsContextLocal(self):
+        admin = MasterKey('admin')
+        seen = {}
+
+        def worker(token):
+            with SessionToken(token=token):
+                with admin:
+                    barrier.wait()
+                # the threads leave admin in the order they entered it
+                if token == 'b':
+                    barrier.wait()
+                seen[token] = self.get_access_keys().get('session_token')
+                if token == 'a':
+                    barrier.wait()
+
+        barrier = threading.Barrier(2)
+        threads = [threading.Thread(target=worker, args=(t,)) for t in ('a', 'b')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(seen, {'a': 'a', 'b': 'b'})
+        self.assertNotIn('session_token', self.get_access_keys())
+
 
 class TestMasterKey(unittest.TestCase):
     """
@@ -624,9 +1265,187 @@ class TestMasterKey(unittest.TestCase):
         return ACCESS_KEYS
 
     def testWithMasterKey(self):
+        registered = self.get_access_keys().get('master_key')
         with MasterKey(master_key='asdf'):
-            self.assertIn('master_key', self.get_access_keys() )
-        self.assertNotIn('master_key', self.get_access_keys() )
+            self.assertEqual(self.get_access_keys()['master_key'], 'asdf')
+        # leaving the block restores the key given to register()
+        self.assertEqual(self.get_access_keys().get('master_key'), registered)
+
+
+class ScriptedServer(socketserver.ThreadingTCPServer):
+    """
+    Local HTTP server answering the n-th request it receives as told by
+    replies[n]: 'ok' answers on a keep-alive connection, 'close' closes the
+    connection without answering and 'hang' never answers.
+    """
+    daemon_threads = True
+
+    def __init__(self, replies):
+        socketserver.ThreadingTCPServer.__init__(
+            self, ('127.0.0.1', 0), ScriptedHandler)
+        self.replies = list(replies)
+        self.methods = []
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/1/classes/GameScore' % self.server_address[1]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class ScriptedHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        while True:
+            request_line = self.rfile.readline()
+            if not request_line:
+                return
+            length = 0
+            for line in iter(self.rfile.readline, b'\r\n'):
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.lower() == 'content-length':
+                    length = int(value)
+            self.rfile.read(length)
+            self.server.methods.append(request_line.split()[0].decode('latin-1'))
+            reply = self.server.replies.pop(0)
+            if reply == 'close':
+                return
+            if reply == 'hang':
+                time.sleep(1)
+                return
+            self.wfile.write(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}')
+
+
+class TestConnectionPool(unittest.TestCase):
+    """
+    Test that requests reuse pooled keep-alive connections.
+    """
+    def tearDown(self):
+        if hasattr(self, 'server'):
+            self.server.stop()
+
+    def testConnectionIsReused(self):
+        connection.POOL.clear()
+        GameScore.Query.all().count()
+        idle = [conn for conns in connection.POOL._idle.values() for conn, _ in conns]
+        self.assertEqual(len(idle), 1)
+
+        GameScore.Query.all().count()
+        reused = [conn for conns in connection.POOL._idle.values() for conn, _ in conns]
+        self.assertEqual(reused, idle)
+
+    def testTimeoutIsNotRetried(self):
+        self.server = ScriptedServer(['ok', 'hang'])
+        pool = connection.ConnectionPool(timeout=0.2)
+        pool.urlopen('GET', self.server.url)
+        self.assertRaises(socket.timeout, pool.urlopen, 'PUT', self.server.url, b'{}')
+        self.assertEqual(self.server.methods, ['GET', 'PUT'])
+
+    def testConnectionWithHighDescriptorIsReused(self):
+        self.server = ScriptedServer(['ok', 'ok'])
+        pool = connection.ConnectionPool()
+        placeholders = []
+        try:
+            try:
+                while len(placeholders) < 1100:
+                    placeholders.append(os.open(os.devnull, os.O_RDONLY))
+            except OSError:
+                self.skipTest('too few file descriptors available')
+            pool.urlopen('GET', self.server.url)
+        finally:
+            for fd in placeholders:
+                os.close(fd)
+        idle = [conn for conns in pool._idle.values() for conn, _ in conns]
+        self.assertGreaterEqual(idle[0].sock.fileno(), 1024)
+        pool.urlopen('GET', self.server.url)
+        self.assertEqual([conn for conns in pool._idle.values() for conn, _ in conns], idle)
+        pool.clear()
+
+    def testUnansweredRequestIsRetriedIfIdempotent(self):
+        self.server = ScriptedServer(['ok', 'close', 'ok', 'close'])
+        pool = connection.ConnectionPool()
+        pool.urlopen('GET', self.server.url)
+        self.assertEqual(pool.urlopen('GET', self.server.url), (200, b'{}'))
+        self.assertRaises((socket.error, six.moves.http_client.HTTPException),
+                          pool.urlopen, 'POST', self.server.url, b'{}')
+        self.assertEqual(self.server.methods, ['GET', 'GET', 'GET', 'POST'])
+
+
+class TestClient(unittest.TestCase):
+    """
+    Test requests sent through a Client of their own.
+    """
+    def setUp(self):
+        self.client = connection.Client(
+            getattr(settings_local, 'APPLICATION_ID'),
+            getattr(settings_local, 'REST_API_KEY'),
+            master_key=getattr(settings_local, 'MASTER_KEY')
+        )
+
+    def tearDown(self):
+        ParseBatcher().batch_delete(GameScore.Query.filter(player_name='Client'))
+        self.client.pool.clear()
+
+    def testWithClient(self):
+        with self.client:
+            self.assertIs(connection.current_client(), self.client)
+            GameScore(score=1, player_name='Client').save()
+        self.assertIs(connection.current_client(), connection.DEFAULT_CLIENT)
+        self.assertTrue(self.client.pool._idle, 'Client pool was not used')
+        self.assertEqual(GameScore.Query.filter(player_name='Client').count(), 1)
+
+    def testSharedClientIsContextLocal(self):
+        outer = dict((name, connection.Client('app', 'key', api_root='http://%s/1' % name))
+                     for name in ('a', 'b'))
+        seen = {}
+
+        def worker(name):
+            with outer[name]:
+                with self.client:
+                    barrier.wait()
+                seen[name] = connection.current_client()
+
+        barrier = threading.Barrier(2)
+        threads = [threading.Thread(target=worker, args=(n,)) for n in outer]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(seen, outer)
+        self.assertIs(connection.current_client(), connection.DEFAULT_CLIENT)
+
+    def testBoundModel(self):
+        class ClientScore(Object):
+            pass
+        ClientScore.ENDPOINT_ROOT = GameScore.ENDPOINT_ROOT
+        self.client.bind(ClientScore)
+
+        ClientScore(score=2, player_name='Client').save()
+        self.assertTrue(self.client.pool._idle, 'Client pool was not used')
+        self.assertEqual(GameScore.Query.filter(player_name='Client').count(), 1)
+
+    def testBatchOfBoundModels(self):
+        class ClientScore(Object):
+            pass
+        ClientScore.ENDPOINT_ROOT = GameScore.ENDPOINT_ROOT
+        self.client.bind(ClientScore)
+
+        scores = [ClientScore(score=3, player_name='Client'),
+                  GameScore(score=4, player_name='Client')]
+        ParseBatcher().batch_save(scores)
+        self.assertTrue(all(score.objectId for score in scores))
+        self.assertTrue(self.client.pool._idle, 'Client pool was not used')
+        self.assertEqual(GameScore.Query.filter(player_name='Client').count(), 2)
+
+    def testClientUrl(self):
+        client = connection.Client('app', 'key', api_root='http://127.0.0.1:9/1')
+        self.assertEqual(client.url(GameScore.ENDPOINT_ROOT),
+                         'http://127.0.0.1:9/1/classes/GameScore')
 
 
 def run_tests():
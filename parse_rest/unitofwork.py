@@ -0,0 +1,290 @@
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import functools
+import threading
+
+from parse_rest import core
+from parse_rest.connection import (BATCH_MAX_REQUESTS, ContextLocal, ParseBatcher,
+                                   copy_context)
+
+
+_CURRENT_UNIT_OF_WORK = ContextLocal('parse_rest_unit_of_work')
+_CURRENT_IDENTITY_MAP = ContextLocal('parse_rest_identity_map')
+
+
+def current_unit_of_work():
+    """the UnitOfWork active in the current context, if any"""
+    return _CURRENT_UNIT_OF_WORK.get()
+
+
+def current_identity_map():
+    """the IdentityMap active in the current context, if any"""
+    return _CURRENT_IDENTITY_MAP.get()
+
+
+class UnitOfWork(object):
+    """
+    Write-behind queue of creates, updates and deletes.
+
+    While a unit of work is active in the current context, save() and
+    delete() on objects only queue the operation. Saving the same object
+    several times queues it once, and deleting it replaces its pending
+    save. The queue is sent through a ParseBatcher once it holds `max_size`
+    objects, `max_delay` seconds after the first operation was queued (from
+    a timer thread, with the client and credentials of the queuing context)
+    and when the `with` block exits. If the block raises, operations still
+    queued are dropped.
+
+        with UnitOfWork():
+            score.save()
+            score.save()    # still one request
+            other.delete()
+
+    Objects get their objectId, createdAt and updatedAt when the batch they
+    are in is sent. New objects pointed to by other queued objects are sent
+    in an earlier batch, so the pointers get their objectId. Users, which
+    need their own session header, are still saved right away. An error of
+    a flush made by the timer is raised by the next flush, once it has sent
+    the queued operations.
+    """
+
+    def __init__(self, max_size=BATCH_MAX_REQUESTS, max_delay=None, batcher=None):
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.batcher = batcher or ParseBatcher()
+        self._pending = collections.OrderedDict()
+        self._timer = None
+        self._error = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def save(self, obj):
+        self._queue(obj, 'save')
+
+    def delete(self, obj):
+        if not obj.objectId:
+            # never created: forget the pending save, there is nothing to delete
+            with self._lock:
+                self._pending.pop(id(obj), None)
+            return
+        self._queue(obj, 'delete')
+
+    def _queue(self, obj, action):
+        with self._lock:
+            self._pending[id(obj)] = (obj, action)
+            due = len(self._pending) >= self.max_size
+            if not due and self.max_delay is not None and self._timer is None:
+                self._timer = self._start_timer()
+        if due:
+            self.flush()
+
+    def _start_timer(self):
+        flush = self._flush_later
+        if copy_context is not None:
+            flush = functools.partial(copy_context().run, flush)
+        timer = threading.Timer(self.max_delay, flush)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def _flush_later(self):
+        try:
+            self.flush()
+        except Exception as e:
+            self._error = e
+
+    def flush(self):
+        """
+        send every queued operation. If a batch fails, the following ones
+        are still sent, except for objects pointing to new objects that
+        could not be created: both stay queued. The first error is raised
+        once everything that could be sent was.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batches, depends = self._batches(list(self._pending.values()))
+                self._pending.clear()
+                self._cancel_timer()
+                error, self._error = self._error, None
+            unsent = []
+            for operations in batches:
+                ready = []
+                for obj, action in operations:
+                    missing = [o for o in depends.get(id(obj), ()) if not o.objectId]
+                    if missing:
+                        # kept with the objects it points to, which failed
+                        unsent.extend((o, 'save') for o in missing)
+                        unsent.append((obj, action))
+                    else:
+                        ready.append((obj, action))
+                try:
+                    self.batcher.batch(getattr(obj, action) for obj, action in ready)
+                except Exception as e:
+                    error = error or e
+            if unsent:
+                self._requeue(unsent)
+            if error is not None:
+                raise error
+
+    def _requeue(self, operations):
+        """queue operations again, before (and unless superseded by) the queued ones"""
+        with self._lock:
+            pending = collections.OrderedDict((id(obj), (obj, action))
+                                              for obj, action in operations)
+            pending.update(self._pending)
+            self._pending = pending
+            if self.max_delay is not None and self._timer is None:
+                self._timer = self._start_timer()
+
+    @staticmethod
+    def _batches(pending):
+        """
+        split operations in batches sent one after the other, so that new
+        objects are created before the objects pointing to them are saved.
+        Also return the new objects each object points to, by id.
+        """
+        new = dict((id(obj), obj) for obj, action in pending
+                   if action == 'save' and not obj.objectId)
+        depends = {}
+        for obj, action in pending:
+            if action == 'save':
+                depends[id(obj)] = [new[id(o)] for o in _pointed(obj)
+                                    if id(o) in new and o is not obj]
+        batches, sent = [], set()
+        while pending:
+            batch = [(obj, action) for obj, action in pending
+                     if all(id(o) in sent for o in depends.get(id(obj), ()))]
+            if not batch:
+                raise core.ParseError('New objects of a unit of work point to each other')
+            batches.append(batch)
+            sent.update(id(obj) for obj, _ in batch)
+            pending = [(obj, action) for obj, action in pending if id(obj) not in sent]
+        return batches, depends
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def clear(self):
+        """drop every queued operation"""
+        with self._lock:
+            self._pending.clear()
+            self._cancel_timer()
+            self._error = None
+
+    def __enter__(self):
+        _CURRENT_UNIT_OF_WORK.push(self)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        _CURRENT_UNIT_OF_WORK.pop()
+        if type is None:
+            self.flush()
+        else:
+            self.clear()
+
+
+def _pointed(obj):
+    """the objects obj points to, in its fields and the lists and dicts they hold"""
+    from parse_rest.datatypes import ParseResource
+    values = list(obj._editable_attrs.values())
+    while values:
+        value = values.pop()
+        if isinstance(value, ParseResource):
+            yield value
+        elif isinstance(value, dict):
+            values.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            values.extend(value)
+
+
+class IdentityMap(object):
+    """
+    One instance per object.
+
+    While an identity map is active in the current context, every object
+    read from Parse (query results, pointers, included objects) with a
+    class and objectId already seen is the instance seen first. Data
+    fetched again is merged into it when its updatedAt is more recent;
+    otherwise it only fills the attributes the instance doesn't have yet.
+
+        with IdentityMap():
+            scores = GameScore.Query.all()
+            scores[0].player is scores[1].player    # same player
+    """
+
+    def __init__(self):
+        self._objects = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._objects)
+
+    @staticmethod
+    def _key(klass, object_id):
+        return klass.__name__, object_id
+
+    def get(self, klass, object_id):
+        return self._objects.get(self._key(klass, object_id))
+
+    def add(self, obj):
+        """remember obj, unless another instance of it is known already"""
+        with self._lock:
+            return self._objects.setdefault(self._key(obj.__class__, obj.objectId), obj)
+
+    def pointer(self, klass, object_id):
+        """the instance of an object only known by its objectId"""
+        with self._lock:
+            obj = self.get(klass, object_id)
+            if obj is None:
+                obj = self.add(klass(objectId=object_id, _is_loaded=False))
+            return obj
+
+    def merge(self, klass, data):
+        """the instance of an object fetched from Parse, updated with data"""
+        with self._lock:
+            obj = self.get(klass, data.get('objectId'))
+            if obj is None:
+                return None
+            if not obj.__dict__.get('_is_loaded', True) or self._is_newer(data, obj):
+                obj._load(data)
+            else:
+                missing = dict((k, v) for k, v in data.items()
+                               if k not in obj.__dict__ and k not in obj.PROTECTED_ATTRIBUTES)
+                if missing:
+                    obj._load(missing)
+            return obj
+
+    @staticmethod
+    def _is_newer(data, obj):
+        from parse_rest.datatypes import Date
+        if not data.get('updatedAt'):
+            return False
+        return obj.updatedAt is None or Date._from_str(data['updatedAt']) > obj.updatedAt
+
+    def clear(self):
+        with self._lock:
+            self._objects.clear()
+
+    def __enter__(self):
+        _CURRENT_IDENTITY_MAP.push(self)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        _CURRENT_IDENTITY_MAP.pop()
@@ -58,12 +58,16 @@ class User(ParseResource):
     def save(self, batch=False):
         session_header = {'X-Parse-Session-Token': self.sessionToken}
         url = self._absolute_url
-        data = self._to_native()
+        data = self._changed_native()
+        if not data:
+            # nothing changed, nothing to send
+            return None
 
         response = User.PUT(url, extra_headers=session_header, batch=batch, **data)
 
         def call_back(response_dict):
             self.updatedAt = response_dict['updatedAt']
+            self._mark_saved(data)
 
         if batch:
             return response, call_back
@@ -71,9 +75,25 @@ class User(ParseResource):
             call_back(response)
 
     @login_required
-    def delete(self):
+    def delete(self, batch=False):
         session_header = {'X-Parse-Session-Token': self.sessionToken}
-        return User.DELETE(self._absolute_url, extra_headers=session_header)
+        response = User.DELETE(self._absolute_url, extra_headers=session_header, batch=batch)
+        if batch:
+            return response, lambda response_dict: None
+        return response
+
+    # batched requests can't carry the session header: send it with the
+    # request run on its own
+
+    @login_required
+    def asave(self):
+        from parse_rest import aio
+        return aio.run(self.save, extra_headers=self.session_header())
+
+    @login_required
+    def adelete(self):
+        from parse_rest import aio
+        return aio.run(self.delete, extra_headers=self.session_header())
 
     @login_required
     def logout(self):
@@ -85,22 +105,22 @@ class User(ParseResource):
     def signup(cls, username, password, **kw):
         response_data = User.POST('', username=username, password=password, **kw)
         response_data.update({'username': username})
-        return cls(**response_data)
+        return cls._from_server(response_data)
 
     @classmethod
     def login(cls, username, passwd):
         login_url = '/'.join([API_ROOT, 'login'])
-        return cls(**User.GET(login_url, username=username, password=passwd))
+        return cls._from_server(User.GET(login_url, username=username, password=passwd))
 
     @classmethod
     def login_auth(cls, auth):
         login_url = User.ENDPOINT_ROOT
-        return cls(**User.POST(login_url, authData=auth))
+        return cls._from_server(User.POST(login_url, authData=auth))
 
     @classmethod
     def current_user(cls):
         user_url = '/'.join([API_ROOT, 'users/me'])
-        return cls(**User.GET(user_url))
+        return cls._from_server(User.GET(user_url))
 
     @staticmethod
     def request_password_reset(email):
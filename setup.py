@@ -27,7 +27,7 @@ setup(
     url='https://github.com/milesrichardson/ParsePy',
     packages=['parse_rest'],
     package_data={"parse_rest": [os.path.join("cloudcode", "*", "*")]},
-    install_requires=['six'],
+    install_requires=['six', 'futures; python_version < "3.2"'],
     maintainer='Miles Richardson',
     maintainer_email='miles.richardson@gmail.com',
     cmdclass={'test': TestCommand},